@@ -1,13 +1,23 @@
-from fastapi import FastAPI # pyright: ignore[reportMissingImports]
+from fastapi import FastAPI, Response # pyright: ignore[reportMissingImports]
 import json
+import os
 
 app = FastAPI()
 
+# the file is parsed once and again only after it changes on disk, requests
+# get the bytes encoded from that parse (same output as returning the dict)
+_snapshot = (None, None)
+
 
 def load_data():
-    with open('patients.json','r') as f:
-        data = json.load(f)
-    return data
+    global _snapshot
+    st = os.stat('patients.json')
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _snapshot[0] != stamp:
+        with open('patients.json','r') as f:
+            data = json.load(f)
+        _snapshot = (stamp, json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode())
+    return _snapshot[1]
 
 @app.get("/")
 def hello():
@@ -19,5 +29,4 @@ def about():
 
 @app.get("/patients")
 def patients():
-    data = load_data()
-    return data 
\ No newline at end of file
+    return Response(load_data(), media_type='application/json')
@@ -0,0 +1,14 @@
+# load tests and micro-benchmarks for patients_manager and serving_model,
+# results as JSON and compared against benchmarks/baseline.json. run from
+# the repo root:
+#
+#   python -m benchmarks run                     # 10k patients, all scenarios
+#   python -m benchmarks run --sizes 1m 10m --out results.json
+#   python -m benchmarks micro                   # validation only, no servers
+#   python -m benchmarks compare results.json    # against the stored baseline
+#   python -m benchmarks seed --sizes 10m        # build the databases ahead of time
+#   python -m benchmarks startup --check         # import time / cold start budget
+#   python -m pytest benchmarks/tests            # the same budget 1.5x looser, for CI
+#
+# the http scenarios start their own uvicorn processes (the client needs
+# httpx) against copies of seeded databases, patients.db is never touched
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from .compare import load, report
+from .micro import run_micro
+from .startup import APPS, BUDGET, check_budget, load_budget, run_startup
+from .suite import SCENARIOS, SIZES, run_http, seeded_db
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def meta(args):
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('func', 'baseline', 'out', 'budget')},
+    }
+
+
+def finish(args, results):
+    current = {'meta': meta(args), 'results': results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.baseline and os.path.exists(args.baseline):
+        print(f'\ncompared with {args.baseline}')
+        return 1 if report(current, load(args.baseline), args.tolerance) else 0
+    return 0
+
+
+def cmd_run(args):
+    results = run_micro(args.only) if not args.only or set(args.only) - set(SCENARIOS) else []
+    for workers in args.workers:
+        results += run_http(args.sizes, args.concurrency, args.duration, args.only, workers)
+    return finish(args, results)
+
+
+def cmd_micro(args):
+    return finish(args, run_micro(args.only))
+
+
+def cmd_compare(args):
+    return 1 if report(load(args.results), load(args.baseline), args.tolerance) else 0
+
+
+def cmd_startup(args):
+    budget = load_budget(args.budget)
+    results = run_startup(args.apps, args.runs, budget)
+    failures = check_budget(results, budget) if args.check else 0
+    return finish(args, results) or (1 if failures else 0)
+
+
+def cmd_seed(args):
+    for size in args.sizes:
+        seeded_db(SIZES[size])
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='API load tests and micro-benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def outputs(p):
+        p.add_argument('--out', help='write the results as JSON to this file')
+        p.add_argument('--baseline', default=BASELINE, help='compare with this results file, "" to skip')
+        p.add_argument('--tolerance', type=float, default=0.15, help='relative change reported, 0.15 = 15%%')
+
+    run = sub.add_parser('run', help='micro-benchmarks, then every http scenario')
+    run.add_argument('--sizes', nargs='+', choices=SIZES, default=['10k'])
+    run.add_argument('--concurrency', nargs='+', type=int, default=[1, 16, 64])
+    run.add_argument('--duration', type=float, default=5, help='seconds measured per scenario and level')
+    run.add_argument('--workers', nargs='+', type=int, default=[1],
+                     help='server processes, more than 1 runs the app through its serve.py')
+    run.add_argument('--only', nargs='+', help=f'scenarios to run ({", ".join(SCENARIOS)}) or micro prefixes '
+                                               '(Patient, UserInput)')
+    outputs(run)
+    run.set_defaults(func=cmd_run)
+
+    micro = sub.add_parser('micro', help='Patient / UserInput validation and computed fields')
+    micro.add_argument('--only', nargs='+')
+    outputs(micro)
+    micro.set_defaults(func=cmd_micro)
+
+    compare = sub.add_parser('compare', help='diff a results file against a baseline')
+    compare.add_argument('results')
+    compare.add_argument('baseline', nargs='?', default=BASELINE)
+    compare.add_argument('--tolerance', type=float, default=0.15)
+    compare.set_defaults(func=cmd_compare)
+
+    startup = sub.add_parser('startup', help='import time and time to first ready request per app')
+    startup.add_argument('--apps', nargs='+', choices=APPS, default=list(APPS))
+    startup.add_argument('--runs', type=int, default=3, help='imports and boots per app')
+    startup.add_argument('--check', action='store_true', help='fail when over the budget file')
+    startup.add_argument('--budget', default=BUDGET)
+    outputs(startup)
+    startup.set_defaults(func=cmd_startup)
+
+    seed = sub.add_parser('seed', help='build the seeded databases without running anything')
+    seed.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    seed.set_defaults(func=cmd_seed)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
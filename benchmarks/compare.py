@@ -0,0 +1,66 @@
+import json
+
+# diffs a results file against a baseline. throughput going down or a
+# latency going up by more than the tolerance is a regression
+
+HIGHER_IS_BETTER = ('rps', 'ops_per_s')
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'us_per_op', 'import_ms', 'ready_ms', 'first_request_ms')
+KEY_FIELDS = ('suite', 'app', 'scenario', 'rows', 'concurrency', 'name')
+
+
+def key(result):
+    # results from before the workers option ran a single process
+    workers = result.get('workers', 1) if result['suite'] == 'http' else None
+    return (*(result.get(field) for field in KEY_FIELDS), workers)
+
+
+def label(result):
+    if result['suite'] == 'micro':
+        return result['name']
+    if result['suite'] == 'startup':
+        return f"{result['app']} startup"
+    rows = f" rows={result['rows']}" if result.get('rows') else ''
+    workers = f" w={result['workers']}" if result.get('workers', 1) > 1 else ''
+    return f"{result['app']} {result['scenario']}{rows}{workers} c={result['concurrency']}"
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current, baseline, tolerance=0.15):
+    # [(label, metric, before, after, relative change, regressed)] for every
+    # metric that moved by more than the tolerance, and the unmatched labels
+    before = {key(r): r for r in baseline['results']}
+    changes = []
+    missing = []
+    for result in current['results']:
+        old = before.pop(key(result), None)
+        if old is None:
+            missing.append(label(result))
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            if metric not in result or not old.get(metric):
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if abs(change) <= tolerance:
+                continue
+            worse = change < 0 if metric in HIGHER_IS_BETTER else change > 0
+            changes.append((label(result), metric, old[metric], result[metric], change, worse))
+    return changes, missing, [label(r) for r in before.values()]
+
+
+def report(current, baseline, tolerance=0.15):
+    # prints the diff, returns the number of regressions
+    changes, new, gone = compare(current, baseline, tolerance)
+    for name, metric, old, value, change, worse in changes:
+        print(f"{'REGRESSION' if worse else 'improved':<11} {name:<48} {metric:<10} "
+              f"{old:>12} -> {value:<12} ({change:+.1%})")
+    for name in new:
+        print(f"{'new':<11} {name}")
+    regressions = sum(worse for *_, worse in changes)
+    print(f'{regressions} regressions, {len(changes) - regressions} improvements '
+          f'beyond {tolerance:.0%} against {baseline["meta"].get("created", "the baseline")}, '
+          f'{len(gone)} baseline entries not run')
+    return regressions
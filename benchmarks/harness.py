@@ -0,0 +1,100 @@
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+# servers and the closed-loop client the http scenarios run on
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def server(app_dir, env_overrides=None, ready_path='/health', timeout=120, workers=1):
+    # uvicorn on a free port, or the app's serve.py launcher with more than
+    # one worker. yields (base url, process) once ready_path answers 200
+    import httpx
+
+    port = free_port()
+    env = dict(os.environ, **(env_overrides or {}))
+    if workers > 1:
+        command = [sys.executable, 'serve.py', '--workers', str(workers)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'main:app']
+    proc = subprocess.Popen(command + ['--port', str(port), '--log-level', 'warning'],
+                            cwd=os.path.join(ROOT, app_dir), env=env)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if httpx.get(url + ready_path, timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f'{app_dir} did not become ready')
+            time.sleep(0.1)
+        yield url, proc
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def drive(url, request, concurrency, duration, warmup=1.0):
+    # `concurrency` clients each send request(client, rng) back to back for
+    # warmup + duration seconds, only the last `duration` seconds are kept.
+    # a status of 400 or above counts as an error, not as a latency
+    import httpx
+
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        record_from = time.perf_counter() + warmup
+        stop_at = record_from + duration
+
+        async def client_loop(rng):
+            nonlocal errors
+            while (start := time.perf_counter()) < stop_at:
+                try:
+                    ok = (await request(client, rng)).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if start < record_from:
+                    continue
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(client_loop(random.Random(i)) for i in range(concurrency)))
+    return summarize(latencies, errors, duration)
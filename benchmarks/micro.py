@@ -0,0 +1,78 @@
+import importlib.util
+import json
+import os
+import sys
+import timeit
+
+from .harness import ROOT
+
+# in-process timings of the request models: validation from a dict and
+# from JSON bytes, and dumping (which evaluates the computed fields). the
+# model modules are loaded by file path, patients_manager/models.py and
+# the serving_model/models directory would clash on sys.path
+
+PATIENT = {'id': 1, 'name': 'Aarav Sharma', 'city': 'Pune', 'age': 34, 'gender': 'male',
+           'height': 1.76, 'weight': 72.5}
+USER_INPUT = {'age': 34, 'weight': 72.5, 'height': 1.76, 'income_lpa': 12.0, 'smoker': False,
+              'city': ' navi mumbai ', 'occupation': 'private_job'}
+
+
+def load(relative_path, name):
+    # the module's own directory is importable while it loads, for its
+    # sibling imports (schema.py imports cities)
+    path = os.path.join(ROOT, relative_path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(os.path.dirname(path))
+    return module
+
+
+def cases():
+    Patient = load('patients_manager/models.py', 'bench_patient_models').Patient
+    UserInput = load('serving_model/schema.py', 'bench_serving_schema').UserInput
+    patient, patient_json = Patient(**PATIENT), json.dumps(PATIENT).encode()
+    user, user_json = UserInput(**USER_INPUT), json.dumps(USER_INPUT).encode()
+    listed_json = json.dumps(dict(USER_INPUT, city='Siliguri')).encode()
+
+    def features(u):
+        return u.bmi, u.age_group, u.lifestyle_risk, u.city_tier, u.income_lpa, u.occupation
+    return {
+        'Patient.validate': lambda: Patient.model_validate(PATIENT),
+        'Patient.validate_json': lambda: Patient.model_validate_json(patient_json),
+        'Patient.computed': lambda: (patient.bmi, patient.verdict),
+        'Patient.dump': patient.model_dump,
+        'UserInput.validate': lambda: UserInput.model_validate(USER_INPUT),
+        'UserInput.validate_json': lambda: UserInput.model_validate_json(user_json),
+        'UserInput.computed': lambda: (user.bmi, user.lifestyle_risk, user.age_group, user.city_tier),
+        'UserInput.dump': user.model_dump,
+        # what /predict does per request: validate, then read every feature
+        'UserInput.request': lambda: features(UserInput.model_validate_json(user_json)),
+        'UserInput.request_listed_city': lambda: features(UserInput.model_validate_json(listed_json)),
+    }
+
+
+def time_call(fn, repeat=5, target=0.2):
+    # calls per timing sized to take about `target` seconds, best of `repeat`
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < target / 10:
+        number *= 10
+    number = max(1, int(number * target / max(timer.timeit(number), 1e-9)))
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run_micro(only=None):
+    results = []
+    for name, fn in cases().items():
+        if only and name.split('.')[0] not in only and name not in only:
+            continue
+        seconds = time_call(fn)
+        result = {'suite': 'micro', 'name': name,
+                  'us_per_op': round(seconds * 1e6, 3), 'ops_per_s': round(1 / seconds, 1)}
+        results.append(result)
+        print(f"{name:<30} {result['us_per_op']:>9.3f} us/op  {result['ops_per_s']:>12,.0f} ops/s", flush=True)
+    return results
@@ -0,0 +1,136 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .harness import ROOT, free_port
+from .micro import USER_INPUT
+
+# cold start of each app: how long `import main` takes (python -X importtime)
+# and how long a fresh uvicorn process needs to answer its ready check and
+# then a first real request. with --check the numbers are held against
+# startup_budget.json, which also lists modules that must stay off the
+# import path (imported lazily, when first needed). the budget assumes the
+# apps' own environment (onnxruntime and skl2onnx installed for serving_model)
+
+BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+APPS = {
+    'patients_manager': {'ready': '/health', 'first': ('GET', '/view', None)},
+    'serving_model': {'ready': '/health', 'first': ('POST', '/predict', USER_INPUT)},
+}
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def app_env(app, workdir):
+    # patients_manager gets a database of its own, boots after the first
+    # find it migrated like a restarted server would
+    if app == 'patients_manager':
+        return dict(os.environ, PATIENTS_DB=os.path.join(workdir, 'patients.db'),
+                    PATIENTS_SNAPSHOT_DIR=os.path.join(workdir, 'snapshots'))
+    return dict(os.environ)
+
+
+def import_profile(app, env):
+    # (total ms of `import main`, {module: cumulative ms} for its direct
+    # imports, every module imported)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=os.path.join(ROOT, app),
+                          env=env, capture_output=True, text=True, check=True)
+    lines = [m for m in map(IMPORT_LINE.match, proc.stderr.splitlines()) if m]
+    # a module is listed after everything it imported, main's direct
+    # imports are the second level lines since the previous top level one
+    direct = {}
+    for m in lines:
+        if len(m[3]) == 2:
+            direct[m[4]] = int(m[2]) / 1000
+        elif not m[3]:
+            if m[4] == 'main':
+                return int(m[2]) / 1000, direct, {m[4] for m in lines}
+            direct = {}
+    raise RuntimeError(f'no import time reported for {app}/main.py')
+
+
+def time_to_ready(app, env, timeout=120):
+    # (ms until the ready check answers 200, ms until the first real
+    # request has answered), both from the process spawn
+    import httpx
+
+    spec = APPS[app]
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+                            cwd=os.path.join(ROOT, app), env=env)
+    try:
+        with httpx.Client(base_url=url, timeout=timeout) as client:
+            while True:
+                try:
+                    if client.get(spec['ready']).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if proc.poll() is not None or time.perf_counter() - started > timeout:
+                    raise RuntimeError(f'{app} did not become ready')
+                time.sleep(0.005)
+            ready = time.perf_counter() - started
+            method, path, body = spec['first']
+            client.request(method, path, json=body).raise_for_status()
+            first = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait()
+    return ready * 1000, first * 1000
+
+
+def load_budget(path=BUDGET):
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_startup(apps, runs=3, budget=None):
+    budget = budget if budget is not None else load_budget()
+    results = []
+    for app in apps:
+        with tempfile.TemporaryDirectory(prefix='startup-') as workdir:
+            env = app_env(app, workdir)
+            imports = [import_profile(app, env) for _ in range(runs)]
+            boots = [time_to_ready(app, env) for _ in range(runs)]
+        total, direct, modules = min(imports, key=lambda profile: profile[0])
+        result = {
+            'suite': 'startup', 'app': app, 'runs': runs,
+            'import_ms': round(total, 1),
+            'ready_ms': round(statistics.median(ready for ready, _ in boots), 1),
+            'first_request_ms': round(statistics.median(first for _, first in boots), 1),
+            'heaviest_imports': {name: round(ms, 1) for name, ms in
+                                 sorted(direct.items(), key=lambda item: -item[1])[:5]},
+            # modules the budget wants deferred that were imported anyway
+            'eager': [name for name in budget.get(app, {}).get('deferred', []) if name in modules],
+        }
+        results.append(result)
+        print(f"{app:<16} import={result['import_ms']}ms  ready={result['ready_ms']}ms  "
+              f"first request={result['first_request_ms']}ms  (median of {runs} boots)", flush=True)
+        print(f"{'':<16} heaviest imports: "
+              + ', '.join(f'{name} {ms}ms' for name, ms in result['heaviest_imports'].items()), flush=True)
+    return results
+
+
+def check_budget(results, budget=None):
+    # prints what is over budget, returns the number of failures
+    budget = budget if budget is not None else load_budget()
+    failures = 0
+    for result in results:
+        limits = budget.get(result['app'], {})
+        for metric in ('import_ms', 'ready_ms', 'first_request_ms'):
+            if metric in limits and result[metric] > limits[metric]:
+                failures += 1
+                print(f"OVER BUDGET {result['app']} {metric} {result[metric]} > {limits[metric]}")
+        if result['eager']:
+            failures += 1
+            print(f"OVER BUDGET {result['app']} imports {', '.join(result['eager'])} at import time")
+    print(f'{failures} startup budget failures')
+    return failures
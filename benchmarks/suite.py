@@ -0,0 +1,127 @@
+import asyncio
+import itertools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .harness import ROOT, drive, server
+
+# the http scenarios. each one is a factory taking the seeded row
+# count, the returned request(client, rng) is what every client repeats
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+# seeded databases are kept here between runs, 10m takes a while to build
+DATA_DIR = os.getenv('BENCH_DATA_DIR', os.path.join(tempfile.gettempdir(), 'fastapi-bench'))
+
+CITIES = ['Mumbai', 'Delhi', 'Pune', 'Jaipur', 'Indore', 'Surat', 'Nagpur', 'Shimla']
+OCCUPATIONS = ['retired', 'freelancer', 'student', 'government_job', 'business_owner', 'unemployed', 'private_job']
+
+
+def view(rows):
+    return lambda client, rng: client.get('/view', params={'limit': 100})
+
+
+def sort(rows):
+    return lambda client, rng: client.get('/sort', params={'sort_by': 'bmi', 'order': 'desc', 'limit': 100})
+
+
+def patient(rows):
+    return lambda client, rng: client.get(f'/patient/{rng.randint(1, rows)}')
+
+
+def create(rows):
+    # ids above the seeded range, never reused within one server run
+    ids = itertools.count(rows + 1)
+
+    def request(client, rng):
+        return client.post('/create', json={
+            'id': next(ids), 'name': 'Bench Patient', 'city': rng.choice(CITIES), 'age': rng.randint(1, 119),
+            'gender': rng.choice(['male', 'female', 'others']),
+            'height': round(rng.uniform(1.4, 2.0), 2), 'weight': round(rng.uniform(40, 130), 1)})
+    return request
+
+
+def edit(rows):
+    return lambda client, rng: client.put(f'/edit/{rng.randint(1, rows)}',
+                                          json={'weight': round(rng.uniform(40, 130), 1)})
+
+
+def user_input(rng):
+    return {'age': rng.randint(18, 80), 'weight': round(rng.uniform(45, 120), 1),
+            'height': round(rng.uniform(1.5, 1.95), 2), 'income_lpa': round(rng.uniform(2, 50), 1),
+            'smoker': rng.random() < 0.2, 'city': rng.choice(CITIES), 'occupation': rng.choice(OCCUPATIONS)}
+
+
+def predict(rows):
+    return lambda client, rng: client.post('/predict', json=user_input(rng))
+
+
+def predict_proba(rows):
+    # same requests with confidence and class probabilities in the response
+    return lambda client, rng: client.post('/predict', params={'probabilities': 'true'}, json=user_input(rng))
+
+
+PATIENT_SCENARIOS = {'view': view, 'sort': sort, 'patient': patient, 'create': create, 'edit': edit}
+PREDICT_SCENARIOS = {'predict': predict, 'predict_proba': predict_proba}
+SCENARIOS = [*PATIENT_SCENARIOS, *PREDICT_SCENARIOS]
+
+
+def seeded_db(rows):
+    # the same rows every time (fixed rng seed), built once per size with
+    # the bench.py seeder so the schema and triggers are the app's own
+    path = os.path.join(DATA_DIR, f'patients-{rows}.db')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        partial = path + '.partial'
+        for leftover in (partial, partial + '-wal', partial + '-shm'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f'import bench; bench.seed({partial!r}, {rows})'],
+                       cwd=os.path.join(ROOT, 'patients_manager'), check=True)
+        os.replace(partial, path)
+        print(f'seeded {rows:,} patients in {time.perf_counter() - start:.1f}s -> {path}', flush=True)
+    return path
+
+
+def run_scenarios(url, app, scenarios, rows, concurrency, duration, workers):
+    results = []
+    for name, factory in scenarios.items():
+        request = factory(rows)
+        for clients in concurrency:
+            result = {'suite': 'http', 'app': app, 'scenario': name, 'rows': rows, 'concurrency': clients,
+                      'workers': workers}
+            result.update(asyncio.run(drive(url, request, clients, duration)))
+            results.append(result)
+            print(f"{app:<16} {name:<13} rows={rows or '-':<9} w={workers:<2} c={clients:<4} {result['rps']:>9} req/s  "
+                  f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  p99={result['p99_ms']}ms  "
+                  f"errors={result['errors']}", flush=True)
+    return results
+
+
+def run_http(sizes, concurrency, duration, only=None, workers=1):
+    results = []
+    patient_scenarios = {k: v for k, v in PATIENT_SCENARIOS.items() if not only or k in only}
+    predict_scenarios = {k: v for k, v in PREDICT_SCENARIOS.items() if not only or k in only}
+    if patient_scenarios:
+        for size in sizes:
+            rows = SIZES[size]
+            source = seeded_db(rows)
+            # the writes change the database, every run starts from a fresh copy
+            work = os.path.join(DATA_DIR, f'run-{os.getpid()}.db')
+            shutil.copyfile(source, work)
+            try:
+                with server('patients_manager', {'PATIENTS_DB': work}, workers=workers) as (url, _):
+                    results += run_scenarios(url, 'patients_manager', patient_scenarios, rows, concurrency, duration,
+                                             workers)
+            finally:
+                for path in (work, work + '-wal', work + '-shm'):
+                    if os.path.exists(path):
+                        os.remove(path)
+    if predict_scenarios:
+        with server('serving_model', workers=workers) as (url, _):
+            results += run_scenarios(url, 'serving_model', predict_scenarios, None, concurrency, duration, workers)
+    return results
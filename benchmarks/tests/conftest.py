@@ -0,0 +1,5 @@
+import os
+import sys
+
+# benchmarks is a package at the repo root, the tests run from any directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
@@ -0,0 +1,29 @@
+import importlib.util
+
+import pytest
+
+from benchmarks.startup import APPS, check_budget, load_budget, run_startup
+
+# the cold start budget as a test, with the time limits loosened by TOLERANCE
+# so a busy CI machine does not fail it. the deferred imports are checked as
+# they are. an app is skipped when this interpreter cannot run it, the exact
+# budget is `python -m benchmarks startup --check` in the apps' environment
+
+TOLERANCE = 1.5
+
+REQUIRES = {
+    'patients_manager': ['fastapi', 'uvicorn', 'httpx'],
+    'serving_model': ['fastapi', 'uvicorn', 'httpx', 'pandas', 'sklearn', 'onnxruntime', 'skl2onnx'],
+}
+
+
+@pytest.mark.parametrize('app', list(APPS))
+def test_startup_within_budget(app):
+    missing = [name for name in REQUIRES[app] if importlib.util.find_spec(name) is None]
+    if missing:
+        pytest.skip(f'{app} needs {", ".join(missing)}')
+    budget = {name: {metric: limit * TOLERANCE if metric.endswith('_ms') else limit
+                     for metric, limit in limits.items()}
+              for name, limits in load_budget().items()}
+    results = run_startup([app], budget=budget)
+    assert check_budget(results, budget) == 0
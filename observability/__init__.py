@@ -0,0 +1,10 @@
+# request, database and inference metrics shared by patients_manager and
+# serving_model, scraped from /metrics in the prometheus text format.
+# the apps run from their own directories and put the repo root on
+# sys.path to import this
+
+from .metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+from .middleware import MetricsMiddleware, instrument, metrics_endpoint
+
+__all__ = ['REGISTRY', 'CONTENT_TYPE', 'Counter', 'Gauge', 'Histogram', 'Registry',
+           'MetricsMiddleware', 'instrument', 'metrics_endpoint']
@@ -0,0 +1,238 @@
+import bisect
+import math
+import threading
+
+# minimal prometheus client: counters, gauges and histograms with labels,
+# rendered in the text exposition format (version 0.0.4). no dependency,
+# and an observation is a bisect plus a couple of additions under a lock
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds, from a cache hit to a slow listing
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        # the child for one label combination, keep a reference to it on hot
+        # paths instead of looking it up per call
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self):
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            lines += child.render(self.name, self.labelnames, values)
+        return lines
+
+
+class _Value:
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, values):
+        return [f'{name}{_labels(labelnames, values)} {_number(self.value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1.0):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        running = 0
+        for bound, n in zip((*self.buckets, math.inf), counts):
+            running += n
+            le = 'le="%s"' % _number(bound)
+            lines.append(f'{name}_bucket{_labels(labelnames, values, le)} {running}')
+        lines.append(f'{name}_sum{_labels(labelnames, values)} {_number(total)}')
+        lines.append(f'{name}_count{_labels(labelnames, values)} {running}')
+        return lines
+
+    def snapshot(self):
+        # the same numbers as a dict, for the apps' JSON /stats routes
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = []
+        running = 0
+        for bound, n in zip((*self.buckets, '+Inf'), counts):
+            running += n
+            cumulative.append([bound, running])
+        return {
+            'count': running,
+            'sum': round(total, 6),
+            'mean': round(total / running, 6) if running else 0.0,
+            'buckets': cumulative,
+        }
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class GaugeFunction(_Metric):
+    # read at scrape time from something that already keeps the number,
+    # fn returns {label values tuple: value}
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, fn):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def render(self):
+        lines = self._header()
+        try:
+            samples = self.fn()
+        except Exception:
+            # a broken collector must not break the whole scrape
+            return lines
+        for values, value in sorted(samples.items()):
+            if value is not None:
+                lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(float(value))}')
+        return lines
+
+
+class CounterFunction(GaugeFunction):
+    # a running total something else already keeps (e.g. cache hits), read
+    # at scrape time like GaugeFunction but typed counter so rate() and
+    # increase() work. the name should end in _total
+    kind = 'counter'
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        # registering the same name twice returns the first one, so modules
+        # can declare their metrics at import without caring about order
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_function(self, name, documentation, labelnames, fn):
+        with self._lock:
+            # replaced, not kept: the callback may close over a new object
+            self._metrics[name] = GaugeFunction(name, documentation, labelnames, fn)
+
+    def counter_function(self, name, documentation, labelnames, fn):
+        with self._lock:
+            self._metrics[name] = CounterFunction(name, documentation, labelnames, fn)
+
+    def render(self) -> bytes:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return ('\n'.join(lines) + '\n').encode()
+
+
+REGISTRY = Registry()
@@ -0,0 +1,74 @@
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .metrics import CONTENT_TYPE, REGISTRY
+
+# plain ASGI middleware (not BaseHTTPMiddleware, which adds a task and a
+# memory stream per request). the route label is the path template
+# (/patient/{patient_id}), never the raw path, so the number of series
+# stays bounded whatever clients send
+
+requests_total = REGISTRY.counter(
+    'http_requests_total', 'Requests handled, by route and status code', ('method', 'route', 'status'))
+request_duration = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time from request start to the last body byte sent', ('method', 'route'))
+requests_in_progress = REGISTRY.gauge(
+    'http_requests_in_progress', 'Requests being handled right now', ('method',))
+
+
+class MetricsMiddleware:
+
+    def __init__(self, app, skip=('/metrics',)):
+        self.app = app
+        self.skip = set(skip)
+        # (method, route, status) -> the metric children it updates, so a
+        # request costs one dict lookup instead of three label lookups
+        self._children = {}
+        self._in_progress = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.skip:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = 500
+        in_progress = self._in_progress.get(method)
+        if in_progress is None:
+            in_progress = self._in_progress[method] = requests_in_progress.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            # set by the router once a route matched
+            route = scope.get('route')
+            template = getattr(route, 'path', None) or 'unmatched'
+            key = (method, template, status)
+            children = self._children.get(key)
+            if children is None:
+                children = self._children[key] = (request_duration.labels(method, template),
+                                                   requests_total.labels(method, template, str(status)))
+            children[0].observe(elapsed)
+            children[1].inc()
+
+
+def metrics_endpoint(request: Request) -> Response:
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def instrument(app, path='/metrics'):
+    # adds the middleware and the scrape endpoint to a FastAPI / Starlette app
+    app.add_middleware(MetricsMiddleware, skip=(path,))
+    app.add_route(path, metrics_endpoint, include_in_schema=False)
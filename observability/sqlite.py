@@ -0,0 +1,83 @@
+import sqlite3
+import time
+
+from .metrics import REGISTRY
+
+# sqlite3 connection / cursor classes that time every execute. pass
+# TimedConnection as the factory to sqlite3.connect, both conn.execute and
+# conn.cursor().execute are covered. the time is the statement's first
+# step (for a SELECT, up to the first row), which is where sqlite does the
+# work for the queries here
+
+query_duration = REGISTRY.histogram(
+    'db_query_duration_seconds', 'Time spent in cursor.execute, by statement kind', ('operation',),
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+query_errors = REGISTRY.counter(
+    'db_query_errors_total', 'Statements that raised, by statement kind', ('operation',))
+
+_children = {}
+
+
+def operation(sql):
+    # first keyword, lower case: select, insert, update, delete, pragma, ...
+    head = sql.lstrip()[:12].split(None, 1)
+    return head[0].lower() if head else 'empty'
+
+
+def _observe(sql, elapsed, failed):
+    op = operation(sql)
+    child = _children.get(op)
+    if child is None:
+        child = _children[op] = query_duration.labels(op)
+    child.observe(elapsed)
+    if failed:
+        query_errors.labels(op).inc()
+
+
+class TimedCursor(sqlite3.Cursor):
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(sql, parameters)
+            failed = False
+            return result
+        finally:
+            _observe(sql, time.perf_counter() - start, failed)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+            failed = False
+            return result
+        finally:
+            _observe(sql, time.perf_counter() - start, failed)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executescript(sql_script)
+            failed = False
+            return result
+        finally:
+            _observe('script', time.perf_counter() - start, failed)
+
+
+class TimedConnection(sqlite3.Connection):
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # the C shortcuts make their cursor without calling cursor() above
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
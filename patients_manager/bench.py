@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from models import compute_bmi, bmi_verdict
+
+# the server and client loop are the ones of the repo wide suite in benchmarks/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from benchmarks import harness
+from benchmarks.harness import drive, summarize
+
+# Offline benchmarks for the patients API.
+#
+#   python bench.py http                # sync vs async routes, 50/200/1000 clients
+#   python bench.py http --path /view --rows 500
+#   python bench.py ingest              # /patients/bulk vs one-by-one /create
+#   python bench.py listing             # 10k-row responses, orjson vs stdlib json
+#   python bench.py writes              # /edit throughput, blind and version-checked
+#   python bench.py search --rows 1000000  # FTS5 name search vs LIKE '%q%'
+#
+# the http benchmark needs httpx (pip install httpx) and starts its own uvicorn
+# processes against a throwaway database, patients.db is never touched
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CITIES = ['Pune', 'Mumbai', 'Delhi', 'Chennai', 'Kolkata', 'Jaipur', 'Indore', 'Surat']
+GENDERS = ['male', 'female', 'others']
+FIRST_NAMES = ['Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Deepa', 'Divya', 'Farhan', 'Gaurav', 'Ishaan',
+               'Kavya', 'Kiran', 'Meera', 'Mohit', 'Neha', 'Nikhil', 'Pooja', 'Priya', 'Rahul', 'Ravi',
+               'Rohan', 'Sanjay', 'Shreya', 'Sneha', 'Suresh', 'Tanvi', 'Varun', 'Vikram', 'Yash', 'Zoya']
+LAST_NAMES = ['Agarwal', 'Banerjee', 'Bose', 'Chopra', 'Das', 'Desai', 'Gupta', 'Iyer', 'Jain', 'Joshi',
+              'Kapoor', 'Khan', 'Kulkarni', 'Kumar', 'Mehta', 'Menon', 'Mishra', 'Nair', 'Patel', 'Pillai',
+              'Rao', 'Reddy', 'Saxena', 'Shah', 'Sharma', 'Singh', 'Sinha', 'Thakur', 'Verma', 'Yadav']
+
+
+def fake_patient(patient_id, rng):
+    height = round(rng.uniform(1.4, 2.0), 2)
+    weight = round(rng.uniform(40, 130), 1)
+    bmi = compute_bmi(height, weight)
+    verdict = bmi_verdict(bmi)
+    name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+    return (patient_id, name, rng.choice(CITIES), rng.randint(1, 119),
+            rng.choice(GENDERS), height, weight, bmi, verdict)
+
+
+def seed(path, rows, seed=42):
+    rng = random.Random(seed)
+    # let the app create (and migrate) the schema the way it does on startup
+    env = dict(os.environ, PATIENTS_DB=path)
+    subprocess.run([sys.executable, '-c', 'import main; main.init_db()'], cwd=HERE, env=env, check=True)
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO patients (patient_id, name, city, age, gender, height, weight, bmi, verdict) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (fake_patient(i, rng) for i in range(1, rows + 1)))
+    conn.commit()
+    conn.close()
+
+
+def server(db_path, env_overrides):
+    return harness.server('patients_manager', dict(env_overrides, PATIENTS_DB=db_path))
+
+
+def get_random(path, rows):
+    # a request for drive(): path with {id} set to a random seeded patient
+    return lambda client, rng: client.get(path.format(id=rng.randint(1, rows)))
+
+
+def bench_http(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        seed(db_path, args.rows)
+        for mode in args.modes:
+            with server(db_path, {'PATIENTS_DB_MODE': mode}) as (url, _):
+                for concurrency in args.concurrency:
+                    result = asyncio.run(drive(url, get_random(args.path, args.rows), concurrency, args.duration))
+                    result.update(mode=mode, concurrency=concurrency, path=args.path)
+                    results.append(result)
+                    print(f"{mode:>5}  c={concurrency:<5} {result['rps']:>9} req/s  "
+                          f"p50={result['p50_ms']}ms  p99={result['p99_ms']}ms  errors={result['errors']}")
+    return results
+
+
+def patient_json(patient_id, rng):
+    row = fake_patient(patient_id, rng)
+    return {'id': row[0], 'name': row[1], 'city': row[2], 'age': row[3], 'gender': row[4],
+            'height': row[5], 'weight': row[6]}
+
+
+def bench_ingest(args):
+    # rows/s of the bulk endpoint vs posting the same kind of rows to /create
+    import httpx
+
+    rng = random.Random(7)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        seed(db_path, 0)
+        with server(db_path, {'PATIENTS_DB_MODE': args.mode}) as (url, _):
+            with httpx.Client(base_url=url, timeout=600) as client:
+                start = time.perf_counter()
+                for i in range(1, args.single_rows + 1):
+                    client.post('/create', json=patient_json(i, rng))
+                elapsed = time.perf_counter() - start
+                results.append({'path': '/create', 'rows': args.single_rows,
+                                'rows_per_s': round(args.single_rows / elapsed, 1)})
+
+                first = args.single_rows + 1
+                body = ''.join(json.dumps(patient_json(i, rng)) + '\n'
+                               for i in range(first, first + args.bulk_rows))
+                start = time.perf_counter()
+                response = client.post('/patients/bulk', content=body,
+                                       headers={'content-type': 'application/x-ndjson'})
+                elapsed = time.perf_counter() - start
+                assert response.json()['inserted'] == args.bulk_rows, response.text
+                results.append({'path': '/patients/bulk', 'rows': args.bulk_rows,
+                                'rows_per_s': round(args.bulk_rows / elapsed, 1)})
+    for result in results:
+        print(f"{result['path']:<16} {result['rows']:>9} rows  {result['rows_per_s']:>12,} rows/s")
+    return results
+
+
+def cpu_seconds(pid):
+    # user + system time of a process, linux only
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def bench_listing(args):
+    # bytes/s and server CPU per request for large listing responses, one
+    # client at a time so the CPU figure belongs to a single request. the
+    # response cache is off, every request goes to the database
+    import httpx
+
+    results = []
+    paths = [f'/view?limit={min(args.rows, 1000)}', '/view', '/view?format=ndjson', '/sort?sort_by=bmi&order=desc']
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        seed(db_path, args.rows)
+        for lib in args.libs:
+            env = {'PATIENTS_JSON': lib, 'PATIENTS_CACHE_SIZE': '0', 'PATIENTS_MAX_PAGE_SIZE': str(args.rows)}
+            with server(db_path, env) as (url, proc), httpx.Client(base_url=url, timeout=60) as client:
+                for path in paths:
+                    client.get(path)
+                    received = 0
+                    cpu_start = cpu_seconds(proc.pid)
+                    start = time.perf_counter()
+                    for _ in range(args.requests):
+                        received += len(client.get(path).content)
+                    elapsed = time.perf_counter() - start
+                    cpu = cpu_seconds(proc.pid) - cpu_start
+                    result = {'lib': lib, 'path': path, 'requests': args.requests,
+                              'bytes_per_request': received // args.requests,
+                              'mb_per_s': round(received / elapsed / 1e6, 1),
+                              'ms_per_request': round(elapsed / args.requests * 1000, 2),
+                              'server_cpu_ms_per_request': round(cpu / args.requests * 1000, 2)}
+                    results.append(result)
+                    print(f"{lib:<7} {path:<32} {result['mb_per_s']:>7} MB/s  "
+                          f"{result['ms_per_request']:>8} ms/req  cpu={result['server_cpu_ms_per_request']} ms/req")
+    return results
+
+
+async def drive_writes(url, rows, concurrency, duration, versioned):
+    # every client edits random patients. versioned clients read the row
+    # first and send its version back, like a form that was open a while,
+    # and count the 409s they get when someone else wrote in between
+    import httpx
+
+    latencies = []
+    errors = 0
+    conflicts = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def client_loop(rng):
+            nonlocal errors, conflicts
+            while time.perf_counter() < stop_at:
+                patient_id = rng.randint(1, rows)
+                body = {'weight': round(rng.uniform(40, 130), 1)}
+                start = time.perf_counter()
+                try:
+                    if versioned:
+                        current = await client.get(f'/patient/{patient_id}')
+                        body['version'] = current.json()[0]['version']
+                    response = await client.put(f'/edit/{patient_id}', json=body)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if response.status_code == 409:
+                    conflicts += 1
+                elif response.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(random.Random(i)) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    result = summarize(latencies, errors, elapsed)
+    result['conflicts'] = conflicts
+    return result
+
+
+def bench_writes(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        seed(db_path, args.rows)
+        with server(db_path, {'PATIENTS_DB_MODE': args.mode}) as (url, _):
+            for versioned in (False, True):
+                for concurrency in args.concurrency:
+                    result = asyncio.run(drive_writes(url, args.rows, concurrency, args.duration, versioned))
+                    result.update(versioned=versioned, concurrency=concurrency, mode=args.mode)
+                    results.append(result)
+                    label = 'versioned' if versioned else 'blind'
+                    print(f"{label:>9}  c={concurrency:<5} {result['rps']:>9} writes/s  p50={result['p50_ms']}ms  "
+                          f"p99={result['p99_ms']}ms  conflicts={result['conflicts']}  errors={result['errors']}")
+    return results
+
+
+def bench_search(args):
+    # query time of the full-text search against the LIKE scan it replaces,
+    # straight on the database (no HTTP), first page of 100 results each
+    import fulltext
+    from rows import SELECT_COLUMNS
+
+    like_sql = (f"SELECT {SELECT_COLUMNS} FROM patients WHERE name LIKE ? OR city LIKE ? "
+                "ORDER BY patient_id LIMIT 100")
+    queries = ['sharma', 'shar', 'sharam', 'priya sharma', 'pune kapoor', 'zoya yadav pune', 'nobody']
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        start = time.perf_counter()
+        seed(db_path, args.rows)
+        print(f'seeded {args.rows:,} rows in {time.perf_counter() - start:.1f}s')
+        conn = sqlite3.connect(db_path)
+        for q in queries:
+            timings = {}
+            for label, run in [
+                ('fts', lambda: fulltext.search(conn, q, {}, None, 100)),
+                # LIKE cannot do several words or typos, it only gets the first word
+                ('like', lambda: conn.execute(like_sql, (f'%{q.split()[0]}%',) * 2).fetchall()),
+            ]:
+                found = len(run())
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    run()
+                timings[label] = ((time.perf_counter() - start) / args.repeat * 1000, found)
+            result = {'q': q, 'rows': args.rows,
+                      'fts_ms': round(timings['fts'][0], 3), 'fts_results': timings['fts'][1],
+                      'like_ms': round(timings['like'][0], 3), 'like_results': timings['like'][1]}
+            results.append(result)
+            print(f"{q!r:<16} fts {result['fts_ms']:>9.3f} ms ({result['fts_results']} hits)   "
+                  f"like {result['like_ms']:>9.3f} ms ({result['like_results']} hits)")
+        conn.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='patients_manager benchmarks')
+    parser.add_argument('--json', help='also write the results to this file')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    http = sub.add_parser('http', help='compare the sync and async data paths over HTTP')
+    http.add_argument('--path', default='/patient/{id}')
+    http.add_argument('--rows', type=int, default=10_000)
+    http.add_argument('--modes', nargs='+', default=['sync', 'async'])
+    http.add_argument('--concurrency', nargs='+', type=int, default=[50, 200, 1000])
+    http.add_argument('--duration', type=float, default=10)
+    http.set_defaults(func=bench_http)
+
+    ingest = sub.add_parser('ingest', help='bulk endpoint vs one-by-one /create')
+    ingest.add_argument('--single-rows', type=int, default=2_000)
+    ingest.add_argument('--bulk-rows', type=int, default=200_000)
+    ingest.add_argument('--mode', default='sync')
+    ingest.set_defaults(func=bench_ingest)
+
+    listing = sub.add_parser('listing', help='throughput and CPU of large listing responses')
+    listing.add_argument('--rows', type=int, default=10_000)
+    listing.add_argument('--requests', type=int, default=50)
+    listing.add_argument('--libs', nargs='+', default=['orjson', 'json'])
+    listing.set_defaults(func=bench_listing)
+
+    writes = sub.add_parser('writes', help='/edit throughput with and without version checks')
+    writes.add_argument('--rows', type=int, default=1_000)
+    writes.add_argument('--mode', default='sync')
+    writes.add_argument('--concurrency', nargs='+', type=int, default=[1, 16, 64])
+    writes.add_argument('--duration', type=float, default=5)
+    writes.set_defaults(func=bench_writes)
+
+    search = sub.add_parser('search', help='full-text name search vs a LIKE scan')
+    search.add_argument('--rows', type=int, default=1_000_000)
+    search.add_argument('--repeat', type=int, default=20)
+    search.set_defaults(func=bench_search)
+
+    args = parser.parse_args(argv)
+    results = args.func(args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
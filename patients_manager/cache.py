@@ -0,0 +1,219 @@
+import array
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+# read-through cache for GET /patient/{id} and the full /view listing.
+#
+# entries hold the already serialized JSON body and its ETag, so a hit costs
+# no query and no serialization, and a matching If-None-Match costs nothing
+# but the lookup. freshness is tracked with generation counters: one per slot
+# (patient_id % slots) plus one for the listing. every write bumps the
+# counters after it commits, an entry is only served while the counters
+# still match the values read *before* it was filled.
+#
+# by default the counters live in this process. with PATIENTS_CACHE_SHARED
+# set to a file path they live in a small mmapped file instead, so a write
+# in one worker invalidates the entries of every worker on the machine
+# (serve.py sets it). process local counters never see another process's
+# writes (`uvicorn --workers N`, ingest.py), so then every entry also
+# expires PATIENTS_CACHE_TTL seconds after it was filled
+
+CACHE_SIZE = int(os.getenv('PATIENTS_CACHE_SIZE', '10000'))
+# the listing is only kept when its body is at most this big
+LISTING_MAX_BYTES = int(os.getenv('PATIENTS_CACHE_LISTING_MAX_BYTES', str(16 * 1024 * 1024)))
+SHARED_PATH = os.getenv('PATIENTS_CACHE_SHARED', '')
+SLOTS = int(os.getenv('PATIENTS_CACHE_SLOTS', '65536'))
+# only without PATIENTS_CACHE_SHARED, 0 = no expiry
+TTL = float(os.getenv('PATIENTS_CACHE_TTL', '5'))
+
+LISTING_SLOT = 0
+
+
+def make_etag(body: bytes) -> str:
+    # content based, so every worker (and every restart) agrees on it
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+    return etag in tags
+
+
+class LocalGenerations:
+
+    def __init__(self, slots):
+        self.slots = slots
+        self._counters = array.array('Q', [0]) * (slots + 1)
+        self._lock = threading.Lock()
+
+    def get(self, slot):
+        return self._counters[slot]
+
+    def bump(self, slots):
+        with self._lock:
+            for slot in slots:
+                self._counters[slot] += 1
+
+
+class SharedGenerations:
+    # same counters in a file-backed mmap. reads are plain memory reads,
+    # bumps take an flock so two workers never lose an increment
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._open()
+        # flock locks belong to the open file, which a forked worker would
+        # share with its parent and siblings, so each process opens its own
+        os.register_at_fork(after_in_child=self._reopen)
+
+    def _reopen(self):
+        self._map.close()
+        os.close(self._fd)
+        self._open()
+
+    def _open(self):
+        size = (self.slots + 1) * 8
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    def get(self, slot):
+        return struct.unpack_from('Q', self._map, slot * 8)[0]
+
+    def bump(self, slots):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                for slot in slots:
+                    value = struct.unpack_from('Q', self._map, slot * 8)[0]
+                    struct.pack_into('Q', self._map, slot * 8, value + 1)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class PatientCache:
+
+    def __init__(self, maxsize=CACHE_SIZE, listing_max_bytes=LISTING_MAX_BYTES, shared_path=SHARED_PATH, slots=SLOTS,
+                 ttl=TTL):
+        self.maxsize = maxsize
+        self.listing_max_bytes = listing_max_bytes
+        self.shared = bool(shared_path)
+        self.ttl = 0 if self.shared else ttl
+        self.generations = SharedGenerations(shared_path, slots) if shared_path else LocalGenerations(slots)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def _slot(self, patient_id):
+        return patient_id % self.generations.slots + 1
+
+    # stamps are read before the database so a write that lands in between
+    # makes the new entry stale instead of wrongly fresh
+    def patient_stamp(self, patient_id):
+        return self.generations.get(self._slot(patient_id))
+
+    def listing_stamp(self):
+        return self.generations.get(LISTING_SLOT)
+
+    def _get(self, key, current_stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stamp, etag, body, expires_at = entry
+            if stamp != current_stamp or expires_at < time.monotonic():
+                del self._entries[key]
+                if stamp != current_stamp:
+                    self.stale += 1
+                else:
+                    self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return etag, body
+
+    def _put(self, key, stamp, body):
+        etag = make_etag(body)
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else float('inf')
+        with self._lock:
+            self._entries[key] = (stamp, etag, body, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return etag
+
+    def get_patient(self, patient_id):
+        # (etag, body) or None
+        return self._get(('patient', patient_id), self.patient_stamp(patient_id))
+
+    def put_patient(self, patient_id, stamp, body):
+        return self._put(('patient', patient_id), stamp, body)
+
+    def get_listing(self, fmt):
+        return self._get(('view', fmt), self.listing_stamp())
+
+    def put_listing(self, fmt, stamp, body):
+        if len(body) > self.listing_max_bytes:
+            return None
+        return self._put(('view', fmt), stamp, body)
+
+    def invalidate(self, patient_ids=()):
+        # call after the write committed. drops this worker's entries right
+        # away, other workers see the bumped generations on their next lookup
+        slots = {LISTING_SLOT} | {self._slot(i) for i in patient_ids}
+        self.generations.bump(slots)
+        with self._lock:
+            for patient_id in patient_ids:
+                self._entries.pop(('patient', patient_id), None)
+            for key in [k for k in self._entries if k[0] == 'view']:
+                del self._entries[key]
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'shared': self.shared,
+                'ttl_s': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'stale': self.stale,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'not_modified': self.not_modified,
+            }
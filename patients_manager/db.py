@@ -0,0 +1,293 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from starlette.concurrency import run_in_threadpool
+
+from models import compute_bmi, bmi_verdict
+import writer
+
+# the metrics package shared with serving_model lives at the repo root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from observability.sqlite import TimedConnection
+
+DB_PATH = os.getenv('PATIENTS_DB', 'patients.db')
+POOL_SIZE = int(os.getenv('PATIENTS_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.getenv('PATIENTS_DB_POOL_TIMEOUT', '5'))
+STATEMENT_CACHE = int(os.getenv('PATIENTS_DB_STATEMENT_CACHE', '256'))
+# negative value = size in KiB (sqlite convention), ~16MB per connection
+CACHE_SIZE = int(os.getenv('PATIENTS_DB_CACHE_SIZE', '-16000'))
+# 'sync' runs queries on Starlette's threadpool (one pooled connection per
+# request), 'async' hands them to dedicated DB threads through a queue
+DB_MODE = os.getenv('PATIENTS_DB_MODE', 'sync')
+EXECUTOR_THREADS = int(os.getenv('PATIENTS_DB_EXECUTOR_THREADS', '4'))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect(path=DB_PATH):
+    # check_same_thread=False because a connection may be checked out in one
+    # worker thread and released from another (FastAPI runs the dependency
+    # teardown separately), the pool guarantees one user at a time
+    # TimedConnection feeds every execute into db_query_duration_seconds
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE, factory=TimedConnection)
+    # return rows as sqlite3.Row (dict-like)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    # NORMAL is durable under WAL except for a power loss right after commit
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size={CACHE_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA busy_timeout=5000')
+    # lets UPDATE statements derive bmi / verdict with the exact python rules
+    conn.create_function('compute_bmi', 2, compute_bmi, deterministic=True)
+    conn.create_function('bmi_verdict', 1, bmi_verdict, deterministic=True)
+    return conn
+
+
+class ConnectionPool:
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        # LIFO so the most recently used (warm cache) connection goes out first
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+
+    def _new_connection(self):
+        with self._lock:
+            if self._opened >= self.size:
+                return None
+            self._opened += 1
+        try:
+            return connect(self.path)
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def acquire(self):
+        start = time.perf_counter()
+        waited = False
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection()
+            if conn is None:
+                waited = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f'no database connection available after {self.timeout}s')
+        wait = time.perf_counter() - start
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += wait
+                self._max_wait = max(self._max_wait, wait)
+        return conn
+
+    def release(self, conn):
+        # never hand out a connection with a half finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'opened': self._opened,
+                'in_use': self._in_use,
+                'idle': self._opened - self._in_use,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total_s': round(self._wait_time, 6),
+                'wait_time_max_s': round(self._max_wait, 6),
+                'timeouts': self._timeouts,
+            }
+
+
+class StoreBase:
+    # run() is for reads. write() is for anything that writes, it goes to
+    # the writer process when serve.py started one (see writer.py) and
+    # through run() on this process's own connections otherwise
+    writer = None
+
+    async def write(self, fn, *args):
+        if self.writer is not None:
+            return await self.writer.run(fn, *args)
+        return await self.run(fn, *args)
+
+
+class ThreadpoolStore(StoreBase):
+    # the original blocking path: each call takes a slot in Starlette's
+    # threadpool and a pooled connection for the duration of the query
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def _call(self, fn, args):
+        with self.pool.connection() as conn:
+            return fn(conn, *args)
+
+    async def run(self, fn, *args):
+        return await run_in_threadpool(self._call, fn, args)
+
+    def stats(self):
+        return {'mode': 'sync'}
+
+
+_STOP = object()
+
+
+class ExecutorStore(StoreBase):
+    # dedicated DB threads, each owning one connection for its whole life,
+    # fed from a single request queue. awaiting callers never occupy a
+    # threadpool slot, so concurrency is bounded by the event loop instead
+
+    def __init__(self, pool, threads=EXECUTOR_THREADS):
+        self.pool = pool
+        self.threads = min(threads, pool.size)
+        self._queue = queue.SimpleQueue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._queue_wait = 0.0
+        self._max_queue_wait = 0.0
+
+    def start(self):
+        if self._workers:
+            return
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._work, name=f'patients-db-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _work(self):
+        conn = self.pool.acquire()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                fn, args, future, loop, queued_at = item
+                wait = time.perf_counter() - queued_at
+                with self._lock:
+                    self._queue_wait += wait
+                    self._max_queue_wait = max(self._max_queue_wait, wait)
+                try:
+                    result = fn(conn, *args)
+                except BaseException as exc:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    loop.call_soon_threadsafe(_set_exception, future, exc)
+                else:
+                    loop.call_soon_threadsafe(_set_result, future, result)
+                with self._lock:
+                    self._completed += 1
+        finally:
+            self.pool.release(conn)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._submitted += 1
+        self._queue.put((fn, args, future, loop, time.perf_counter()))
+        return await future
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': 'async',
+                'threads': len(self._workers),
+                'queue_depth': self._queue.qsize(),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'queue_wait_total_s': round(self._queue_wait, 6),
+                'queue_wait_max_s': round(self._max_queue_wait, 6),
+            }
+
+
+# the caller may have gone away (client disconnect cancels the task)
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, exc):
+    if not future.done():
+        future.set_exception(exc)
+
+
+Store = ThreadpoolStore | ExecutorStore
+
+pool = ConnectionPool()
+
+if DB_MODE == 'async':
+    store = ExecutorStore(pool)
+elif DB_MODE == 'sync':
+    store = ThreadpoolStore(pool)
+else:
+    raise ValueError(f"PATIENTS_DB_MODE must be 'sync' or 'async', got {DB_MODE!r}")
+store.writer = writer.from_env()
+
+
+# FastAPI dependency, every route talks to the database through the store
+def get_store():
+    return store
@@ -0,0 +1,120 @@
+import os
+import re
+import string
+import unicodedata
+
+from rows import COLUMNS, patient_row
+from repository import search_conditions
+
+# /patients/search?q= over the patients_fts index (migration 6).
+#
+# every word of q has to match a word of the name or city, as a prefix
+# ("sha" finds "Sharma"). a word that is not the start of any indexed term
+# is treated as a typo: it is replaced by the indexed terms one edit away
+# (insert, delete, replace or swap one letter), which are looked up in the
+# vocab table by equality, so the cost follows the length of the word, not
+# the size of the table. results are ranked by bm25, name hits weigh more
+# than city hits, and paged with a (rank, patient_id) cursor
+
+# 0 turns typo matching off
+TYPOS = os.getenv('PATIENTS_SEARCH_TYPOS', '1') == '1'
+# words shorter than this are only prefix matched, one edit away from a
+# two letter word is almost everything
+MIN_TYPO_LENGTH = int(os.getenv('PATIENTS_SEARCH_MIN_TYPO_LENGTH', '4'))
+NAME_WEIGHT = 2.0
+CITY_WEIGHT = 1.0
+
+ALPHABET = string.ascii_lowercase + string.digits
+
+
+def terms(q):
+    # the same folding the unicode61 tokenizer applies: lower case, no
+    # diacritics, split on anything that is not a letter or digit
+    folded = unicodedata.normalize('NFKD', q.lower())
+    folded = ''.join(c for c in folded if not unicodedata.combining(c))
+    return re.findall(r'\w+', folded)
+
+
+def edits1(word):
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    deletes = [a + b[1:] for a, b in splits if b]
+    swaps = [a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1]
+    replaces = [a + c + b[1:] for a, b in splits if b for c in ALPHABET]
+    inserts = [a + c + b for a, b in splits for c in ALPHABET]
+    return set(deletes + swaps + replaces + inserts) - {word}
+
+
+def has_prefix(conn, term):
+    row = conn.execute('SELECT 1 FROM patients_fts_vocab WHERE term >= ? AND term < ? LIMIT 1',
+                       (term, term + '\uffff')).fetchone()
+    return row is not None
+
+
+def close_terms(conn, term):
+    # a few hundred candidates for a normal word, two edits would be ~100k
+    candidates = list(edits1(term))
+    found = []
+    # stay under sqlite's bound parameter limit
+    for i in range(0, len(candidates), 900):
+        batch = candidates[i:i + 900]
+        placeholders = ','.join('?' * len(batch))
+        found += [row[0] for row in conn.execute(
+            f'SELECT term FROM patients_fts_vocab WHERE term IN ({placeholders})', batch)]
+    return sorted(found)
+
+
+def match_expression(conn, q):
+    # the FTS5 query for q, or None when some word matches nothing at all
+    parts = []
+    for term in terms(q):
+        if has_prefix(conn, term):
+            parts.append(f'"{term}"*')
+            continue
+        close = close_terms(conn, term) if TYPOS and len(term) >= MIN_TYPO_LENGTH else []
+        if not close:
+            return None
+        parts.append('(' + ' OR '.join(f'"{c}"' for c in close) + ')')
+    return ' AND '.join(parts) if parts else None
+
+
+def search_sql(filters, seek):
+    # rank is bm25 with the column weights below, lower is better. every
+    # match has to be scored before the first page is known, so a word that
+    # is in half the table costs more than a rare one
+    columns = ', '.join(f'p.{c}' for c in COLUMNS)
+    t = 'f.' if filters else ''
+    ranked = f"patients_fts MATCH ? AND {t}rank MATCH 'bm25({NAME_WEIGHT}, {CITY_WEIGHT})'"
+    if seek:
+        ranked += f' AND ({t}rank, {t}rowid) > (?, ?)'
+    if not filters:
+        # rank and cut in the index first, only the page is joined to patients
+        return f"""
+            SELECT {columns}, m.rank FROM (
+                SELECT rowid, rank FROM patients_fts
+                WHERE {ranked}
+                ORDER BY rank, rowid
+                LIMIT ?) m
+            JOIN patients p ON p.patient_id = m.rowid
+            ORDER BY m.rank, m.rowid
+            """
+    conditions, _ = search_conditions(filters, 'p')
+    return f"""
+            SELECT {columns}, f.rank FROM patients_fts f
+            JOIN patients p ON p.patient_id = f.rowid
+            WHERE {ranked} AND {' AND '.join(conditions)}
+            ORDER BY f.rank, f.rowid
+            LIMIT ?
+            """
+
+
+def search(conn, q, filters, after, limit):
+    # returns [(rank, PatientRow)], after is None or (rank, patient_id)
+    expression = match_expression(conn, q)
+    if expression is None:
+        return []
+    _, filter_params = search_conditions(filters, 'p')
+    params = [expression, *(after or ()), *filter_params, limit]
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(search_sql(filters, after is not None), params)
+    return [(row[-1], patient_row(cursor, row[:-1])) for row in cursor]
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from pydantic import ValidationError
+
+from models import Patient, compute_bmi, bmi_verdict
+
+# bulk loading: records are validated with Patient a chunk at a time and
+# each chunk is written with one executemany inside one transaction, instead
+# of a commit (and an fsync) per patient like /create does
+#
+#   python ingest.py registry.ndjson
+#   python ingest.py registry.json --chunk 10000
+
+BULK_CHUNK = int(os.getenv('PATIENTS_BULK_CHUNK', '5000'))
+# at most this many row errors are listed in a report, the counts stay exact
+MAX_REPORTED_ERRORS = int(os.getenv('PATIENTS_BULK_MAX_ERRORS', '1000'))
+
+INSERT_SQL = ('INSERT INTO patients (patient_id, name, city, age, gender, height, weight, bmi, verdict) '
+              'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def parse_line(line_no, line):
+    # (line_no, record or None, error), None for blank lines. line is str
+    # (a file opened as utf-8) or the raw bytes of a request body line
+    if not line.strip():
+        return None
+    if isinstance(line, bytes):
+        try:
+            line = line.decode('utf-8')
+        except UnicodeDecodeError as e:
+            return line_no, None, f'invalid UTF-8: {e}'
+    try:
+        return line_no, json.loads(line), None
+    except ValueError as e:
+        return line_no, None, f'invalid JSON: {e}'
+
+
+def iter_ndjson(lines):
+    for line_no, line in enumerate(lines):
+        item = parse_line(line_no, line)
+        if item:
+            yield item
+
+
+def iter_json_array(data):
+    # checked eagerly (not a generator) so a bad body fails before any write
+    if not isinstance(data, list):
+        raise ValueError('expected a JSON array of patients')
+    return ((index, record, None) for index, record in enumerate(data))
+
+
+def validate_chunk(items):
+    # items are (row, record, parse_error); returns (patients, errors)
+    patients = []
+    errors = []
+    for row, record, parse_error in items:
+        if parse_error:
+            errors.append({'row': row, 'detail': parse_error})
+            continue
+        try:
+            patients.append((row, Patient.model_validate(record)))
+        except ValidationError as e:
+            errors.append({'row': row, 'detail': e.errors(include_url=False, include_context=False)})
+    return patients, errors
+
+
+def write_chunk(conn, patients):
+    # one transaction per chunk. the write lock is taken up front so the
+    # duplicate check and the insert see the same table. returns the
+    # duplicate errors, everything else is inserted
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        ids = [p.id for _, p in patients]
+        existing = set()
+        # stay below sqlite's bound parameter limit
+        for batch in chunked(ids, 900):
+            marks = ','.join('?' * len(batch))
+            existing.update(r[0] for r in conn.execute(
+                f'SELECT patient_id FROM patients WHERE patient_id IN ({marks})', batch))
+
+        rows = []
+        errors = []
+        for row, p in patients:
+            if p.id in existing:
+                errors.append({'row': row, 'id': p.id, 'detail': 'Patient already exists'})
+                continue
+            existing.add(p.id)
+            bmi = compute_bmi(p.height, p.weight)
+            rows.append((p.id, p.name, p.city, p.age, p.gender, p.height, p.weight, bmi, bmi_verdict(bmi)))
+
+        conn.executemany(INSERT_SQL, rows)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(rows), errors
+
+
+class Report:
+
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def add(self, received, inserted, errors):
+        self.received += received
+        self.inserted += inserted
+        self.failed += len(errors)
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def as_dict(self):
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def load_file(conn, path, chunk_size=BULK_CHUNK):
+    report = Report()
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            items = iter_json_array(json.load(f))
+        else:
+            items = iter_ndjson(f)
+        for chunk in chunked(items, chunk_size):
+            patients, errors = validate_chunk(chunk)
+            inserted, duplicates = write_chunk(conn, patients)
+            report.add(len(chunk), inserted, errors + duplicates)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load patients from a .json array or an .ndjson file')
+    parser.add_argument('path')
+    parser.add_argument('--db', default=os.getenv('PATIENTS_DB', 'patients.db'))
+    parser.add_argument('--chunk', type=int, default=BULK_CHUNK)
+    args = parser.parse_args(argv)
+
+    os.environ['PATIENTS_DB'] = args.db
+    from db import pool
+    from migrations import migrate
+
+    start = time.perf_counter()
+    with pool.connection() as conn:
+        migrate(conn)
+        report = load_file(conn, args.path, args.chunk)
+    elapsed = time.perf_counter() - start
+
+    result = report.as_dict()
+    print(json.dumps({k: v for k, v in result.items() if k != 'errors'}))
+    for error in result['errors']:
+        print(json.dumps(error), file=sys.stderr)
+    print(f"{report.received / elapsed:,.0f} rows/s", file=sys.stderr)
+    return 1 if report.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,84 +1,73 @@
-from fastapi import FastAPI, Path, HTTPException, Query
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, computed_field
-from typing import Annotated, Literal, Optional
+from fastapi import FastAPI, Path, HTTPException, Query, Depends, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
+from typing import Annotated, Literal, Optional, Union
+from contextlib import asynccontextmanager
+from pydantic import Field
+import asyncio
 import json
+import os
 
 import sqlite3
 
-def get_connection():
-     # allow usage from multiple threads (typical for FastAPI)
-    conn = sqlite3.connect('patients.db', check_same_thread=False)
-     # return rows as sqlite3.Row (dict-like)
-    conn.row_factory = sqlite3.Row
-    return conn
+from db import pool, store, get_store, PoolTimeout, Store
+from models import Patient, UpdatePatient, PatientRecord, PatientPage
+import repository
+import fulltext
+import ingest
+import snapshot
+from migrations import MIGRATIONS, migrate, schema_version
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, decode_cursor, page_body, ranked_page_body, stream_rows
+from cache import PatientCache, etag_matches, make_etag
+from rows import RowsResponse, dumps
+from observability import REGISTRY, instrument
+
+MEDIA_TYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+# a page, or the whole table when limit and cursor are left out
+LISTING_RESPONSES = {200: {'content': {'application/x-ndjson': {'schema': {'type': 'string', 'description': 'one patient JSON object per line'}}}}}
+
+cache = PatientCache()
+
+# seconds /health waits for the database before reporting it unreachable
+HEALTH_TIMEOUT = float(os.getenv('PATIENTS_HEALTH_TIMEOUT', '2'))
 
 def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-                   create table if not exists patients(
-                       patient_id int primary key,
-                       name text not null,
-                       city text not null,
-                       age integer not null,
-                       gender text not null check(gender in ('male', 'female', 'others')),
-                       height real not null,
-                       weight real not null,
-                       bmi real not null,
-                       verdict text not null);
-                   """) 
-    conn.commit()
-    conn.close()
-app = FastAPI()
-
-@app.on_event('startup')
-def on_startup():
+    with pool.connection() as conn:
+        migrate(conn)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # migrate() is a single PRAGMA read when the schema is current
     init_db()
+    store.start()
+    snapshot.exporter.start()
+    yield
+    snapshot.exporter.stop()
+    store.stop()
+    if store.writer:
+        store.writer.close()
+    pool.close()
+
+app = FastAPI(lifespan=lifespan)
+# per-route latency / status counters and GET /metrics, db query timing
+# comes from the connections themselves (db.connect)
+instrument(app)
+REGISTRY.gauge_function('db_pool_connections', 'Pooled connections by state', ('state',),
+                        lambda: {(state,): pool.stats()[state] for state in ('in_use', 'idle')})
+REGISTRY.counter_function('patient_cache_lookups_total', 'Patient cache lookups since start', ('result',),
+                          lambda: {(result,): cache.stats()[result] for result in ('hits', 'misses', 'stale', 'expired', 'not_modified')})
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={'detail': 'Database busy, try again'})
+
+@app.exception_handler(repository.VersionConflict)
+def version_conflict_handler(request: Request, exc: repository.VersionConflict):
+    return JSONResponse(status_code=409, content={'detail': 'Patient was changed by someone else', 'version': exc.current_version})
+
+@app.exception_handler(InvalidCursor)
+def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=400, content={'detail': f'Invalid cursor: {exc}'})
     
-#pydantic model for creating the patient
-class Patient(BaseModel):
-
-    id: Annotated[int, Field(..., description='ID of the patient', examples=['1'])]
-    name: Annotated[str, Field(..., description='Name of the patient')]
-    city: Annotated[str, Field(..., description='City where the patient is living')]
-    age: Annotated[int, Field(..., gt=0, lt=120, description='Age of the patient')]
-    gender: Annotated[Literal['male', 'female', 'others'], Field(..., description='Gender of the patient')]
-    height: Annotated[float, Field(..., gt=0, description='Height of the patient in mtrs')]
-    weight: Annotated[float, Field(..., gt=0, description='Weight of the patient in kgs')]
-
-    @computed_field
-    @property
-    def bmi(self) -> float:
-        bmi = round(self.weight/(self.height**2),2)
-        return bmi
-    
-    @computed_field
-    @property
-    def verdict(self) -> str:
-        if self.bmi < 18.5:
-            return "Underweight"
-        elif self.bmi < 25:
-            return "Normal"
-        elif self.bmi < 30:
-            return "Overweight"     
-        else:
-            return "Obese"
-
-# pydantic model for updating the user info
-class UpdatePatient(BaseModel):
-    name: Annotated[Optional[str], Field(description='Name of the patient')] = None
-    city: Annotated[Optional[str], Field(description='City where the patient is living')] = None
-    age: Annotated[Optional[int], Field(gt=0, lt=120, description='Age of the patient')] = None
-    gender: Annotated[Optional[Literal['male', 'female', 'others']], Field(description='Gender of the patient')] = None
-    height: Annotated[Optional[float], Field(gt=0, description='Height of the patient in mtrs')] = None
-    weight: Annotated[Optional[float], Field(gt=0, description='Weight of the patient in kgs')] = None
-
-
-def save_data(data):
-    with open('patients.json', 'w') as f:
-        json.dump(data, f)
-        
 
 @app.get("/")
 def hello():
@@ -88,35 +77,87 @@ def hello():
 def about():
     return {'message': 'A fully functional API to manage your patient records'}
 
-@app.get('/view')
-def view():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT * FROM patients''')
-    rows = cursor.fetchall()
-    result = [dict(row) for row in rows]
-    conn.close()
-    return result
-
-@app.get('/patient/{patient_id}')
-def view_patient(patient_id: int = Path(..., description='ID of the patient in the DB', example='P001')):
+@app.get('/pool')
+def pool_stats():
+    return {'pool': pool.stats(), 'store': store.stats(), 'writer': store.writer.stats() if store.writer else None}
+
+@app.get('/stats')
+def stats():
+    return {'pool': pool.stats(), 'store': store.stats(), 'writer': store.writer.stats() if store.writer else None, 'cache': cache.stats(), 'snapshot': snapshot.exporter.stats()}
+
+@app.get('/health')
+async def health(store: Store = Depends(get_store)):
+    # ready when the database answers and is migrated to what this code expects
+    try:
+        version = await asyncio.wait_for(store.run(schema_version), HEALTH_TIMEOUT)
+    except Exception as e:
+        return JSONResponse(status_code=503, content={'status': 'UNAVAILABLE', 'database': f'unreachable: {type(e).__name__}'})
+    if version != len(MIGRATIONS):
+        return JSONResponse(status_code=503, content={'status': 'UNAVAILABLE', 'database': f'schema version {version}, expected {len(MIGRATIONS)}'})
+    return {'status': 'OK', 'database': 'ok', 'schema_version': version}
+
+def cached_response(request, etag, body, media_type):
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        cache.count_not_modified()
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(body, media_type=media_type, headers={'ETag': etag})
+
+async def fill_listing(chunks, fmt, stamp):
+    # passes the stream through and keeps a copy, which becomes the cached
+    # listing if it stays under the size limit
+    body = []
+    size = 0
+    async for chunk in chunks:
+        yield chunk
+        if body is not None:
+            body.append(chunk)
+            size += len(chunk)
+            if size > cache.listing_max_bytes:
+                body = None
+    if body is not None:
+        cache.put_listing(fmt, stamp, b''.join(body))
+
+@app.get('/view', response_model=Union[PatientPage, list[PatientRecord]], responses=LISTING_RESPONSES)
+async def view(request: Request, limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE, description='Page size, omit to stream the whole table'), cursor: Optional[str] = Query(None, description='next_cursor from the previous page'), format: Literal['json', 'ndjson'] = Query('json', description='Format of the streamed listing'), store: Store = Depends(get_store)):
+
+    if limit is None and cursor is None:
+        if not cache.enabled:
+            return StreamingResponse(stream_rows(store, repository.page_patients, fmt=format), media_type=MEDIA_TYPES[format])
+        cached = cache.get_listing(format)
+        if cached:
+            return cached_response(request, *cached, MEDIA_TYPES[format])
+        stamp = cache.listing_stamp()
+        chunks = stream_rows(store, repository.page_patients, fmt=format)
+        return StreamingResponse(fill_listing(chunks, format, stamp), media_type=MEDIA_TYPES[format])
+
+    after = decode_cursor(cursor, None, 'asc') if cursor else None
+    limit = limit or DEFAULT_PAGE_SIZE
+    rows = await store.run(repository.page_patients, after, limit + 1)
+    return RowsResponse(page_body(rows, limit))
+
+@app.get('/patient/{patient_id}', response_model=list[PatientRecord])
+async def view_patient(request: Request, patient_id: int = Path(..., description='ID of the patient in the DB', example='P001'), store: Store = Depends(get_store)):
+    # served as stored bytes with an ETag, a hit needs no query and no
+    # serialization and a matching If-None-Match gets an empty 304
+    cached = cache.get_patient(patient_id) if cache.enabled else None
+    if cached:
+        return cached_response(request, *cached, 'application/json')
+
+    stamp = cache.patient_stamp(patient_id)
     # load all the patient
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(f'select * from patients where patient_id=\"{patient_id}\"')
-    rows = cursor.fetchall()
+    result = await store.run(repository.get_patient, patient_id)
     
-    if not rows:
+    if not result:
         raise HTTPException(status_code=404, detail='Patient not found')
     
-    result = [dict(row) for row in rows]
-    conn.close()
-    return result
+    body = dumps(result)
+    etag = cache.put_patient(patient_id, stamp, body) if cache.enabled else make_etag(body)
+    return cached_response(request, etag, body, 'application/json')
 
-@app.get('/sort')
-def sort_patients(sort_by: str = Query(..., description='Sort on the basis of height, weight or bmi'), order: str = Query('asc', description='sort in asc or desc order')):
+@app.get('/sort', response_model=Union[PatientPage, list[PatientRecord]], responses=LISTING_RESPONSES)
+async def sort_patients(sort_by: str = Query(..., description='Sort on the basis of height, weight or bmi'), order: str = Query('asc', description='sort in asc or desc order'), limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE, description='Page size, omit to stream the whole table'), cursor: Optional[str] = Query(None, description='next_cursor from the previous page'), format: Literal['json', 'ndjson'] = Query('json', description='Format of the streamed listing'), store: Store = Depends(get_store)):
 
-    valid_fields = ['height', 'weight', 'bmi']
+    valid_fields = repository.SORTABLE_FIELDS
 
     if sort_by not in valid_fields:
         raise HTTPException(status_code=400, detail=f'Invalid field select from {valid_fields}')
@@ -124,133 +165,136 @@ def sort_patients(sort_by: str = Query(..., description='Sort on the basis of he
     if order not in ['asc', 'desc']:
         raise HTTPException(status_code=400, detail='Invalid order select between asc and desc')
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(f"""
-                   SELECT * FROM patients
-                   ORDER BY {sort_by} {order};
-                   """)
-    rows = cursor.fetchall()
-    result = [dict(row) for row in rows]
-    conn.close()
-    
-    return result
+    if limit is None and cursor is None:
+        return StreamingResponse(stream_rows(store, repository.page_sorted, sort_by, order, fmt=format, sort_by=sort_by, order=order), media_type=MEDIA_TYPES[format])
+
+    after = decode_cursor(cursor, sort_by, order) if cursor else None
+    limit = limit or DEFAULT_PAGE_SIZE
+    rows = await store.run(repository.page_sorted, sort_by, order, after, limit + 1)
+    return RowsResponse(page_body(rows, limit, sort_by, order))
+
+@app.get('/patients/search', response_model=PatientPage)
+async def search_patients(q: Optional[str] = Query(None, min_length=1, description='Words to find in the name or city, prefixes and small typos match'), city: Optional[str] = Query(None), gender: Optional[Literal['male', 'female', 'others']] = Query(None), verdict: Optional[str] = Query(None), min_age: Optional[int] = Query(None, ge=0), max_age: Optional[int] = Query(None, ge=0), min_bmi: Optional[float] = Query(None, ge=0), max_bmi: Optional[float] = Query(None, ge=0), limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE), cursor: Optional[str] = Query(None, description='next_cursor from the previous page'), store: Store = Depends(get_store)):
+    # filtered in SQL, pages in patient_id order like /view. with q the
+    # matches come best first instead, see fulltext.py
+    filters = {name: value for name, value in {'city': city, 'gender': gender, 'verdict': verdict, 'min_age': min_age, 'max_age': max_age, 'min_bmi': min_bmi, 'max_bmi': max_bmi}.items() if value is not None}
+    if q is not None:
+        after = decode_cursor(cursor, 'rank', 'asc') if cursor else None
+        results = await store.run(fulltext.search, q, filters, after, limit + 1)
+        return RowsResponse(ranked_page_body(results, limit))
+    after = decode_cursor(cursor, None, 'asc') if cursor else None
+    rows = await store.run(repository.search_patients, filters, after, limit + 1)
+    return RowsResponse(page_body(rows, limit))
+
+@app.get('/patients/snapshot', responses={200: {'content': {t: {'schema': {'type': 'string', 'format': 'binary'}} for t in snapshot.MEDIA_TYPES.values()}}, 503: {'description': 'No export yet'}})
+def patients_snapshot(format: Literal['ndjson', 'parquet'] = Query('ndjson', description='gzipped NDJSON, or Parquet when the server has pyarrow')):
+    # the whole table as of the last export (see snapshot.py), sent from a
+    # file: no query, no serialization, and range requests / ETags for free
+    manifest = snapshot.current()
+    if manifest is None:
+        return JSONResponse(status_code=503, content={'detail': 'No snapshot exported yet, try again shortly'}, headers={'Retry-After': '5'})
+    if format not in manifest['files']:
+        raise HTTPException(status_code=404, detail=f'No {format} snapshot, the server exports {list(manifest["files"])}')
+    file = manifest['files'][format]['file']
+    return FileResponse(os.path.join(snapshot.SNAPSHOT_DIR, file), media_type=snapshot.MEDIA_TYPES[format], filename=file,
+                        headers={'X-Snapshot-Created': manifest['created'], 'X-Snapshot-Rows': str(manifest['rows'])})
+
+@app.get('/patients/stats')
+async def patient_stats(group_by: Literal['city', 'verdict'] = Query('city', description='Group patients by city or verdict'), percentiles: list[Annotated[float, Field(gt=0, le=100)]] = Query([50, 90, 99], description='bmi percentiles to report'), store: Store = Depends(get_store)):
+    # count, mean and percentile bmi per group, from the summary tables
+    groups = await store.run(repository.group_stats, group_by, percentiles)
+    return {'group_by': group_by, 'groups': groups}
 
 @app.post('/create')
-def create_patient(patient: Patient):
+async def create_patient(patient: Patient, store: Store = Depends(get_store)):
 
-    # load the data
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''INSERT INTO patients (patient_id, name, city, age, gender, height, weight,bmi, verdict) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', (patient.id, patient.name, patient.city, patient.age, patient.gender, patient.height, patient.weight, patient.bmi, patient.verdict))
-        
-        conn.commit()
+        await store.write(repository.insert_patient, patient)
     except sqlite3.IntegrityError as e:
-        conn.close()
         raise HTTPException(status_code=400, detail='Patient already exists')
-    finally:
-        conn.close()
+    cache.invalidate([patient.id])
     
     # return statuscode to variafy patient created 
     return JSONResponse(status_code=201, content={'message': 'Patient created successfully'})
 
 
-@app.put("/edit/{id}")
-def update_patient(id: int, patch: UpdatePatient):
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # 1) fetch existing patient row (parameterized)
-    cur.execute("SELECT * FROM patients WHERE patient_id = ?", (id,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Patient not found")
+@app.post('/patients/bulk', status_code=201, openapi_extra={'requestBody': {'required': True, 'content': {
+    'application/json': {'schema': {'type': 'array', 'items': Patient.model_json_schema()}},
+    'application/x-ndjson': {'schema': {'type': 'string', 'description': 'one Patient JSON object per line'}},
+}}})
+async def bulk_create_patients(request: Request, store: Store = Depends(get_store)):
+    # NDJSON bodies are consumed as they arrive, a JSON array has to be
+    # parsed whole before the first chunk can be validated
+    report = ingest.Report()
+    if 'ndjson' in request.headers.get('content-type', ''):
+        items = ndjson_items(request.stream())
+    else:
+        try:
+            items = array_items(ingest.iter_json_array(json.loads(await request.body())))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= ingest.BULK_CHUNK:
+            await ingest_chunk(store, chunk, report)
+            chunk = []
+    if chunk:
+        await ingest_chunk(store, chunk, report)
+
+    return report.as_dict()
+
+async def ingest_chunk(store, chunk, report):
+    patients, errors = ingest.validate_chunk(chunk)
+    inserted, duplicates = await store.write(ingest.write_chunk, patients)
+    if inserted:
+        cache.invalidate()
+    report.add(len(chunk), inserted, errors + duplicates)
+
+async def ndjson_items(stream):
+    pending = b''
+    line_no = 0
+    async for data in stream:
+        pending += data
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            item = ingest.parse_line(line_no, line)
+            line_no += 1
+            if item:
+                yield item
+    item = ingest.parse_line(line_no, pending)
+    if item:
+        yield item
+
+async def array_items(items):
+    for item in items:
+        yield item
+
 
-    existing = dict(row)  # sqlite3.Row -> dict
+@app.put("/edit/{id}")
+async def update_patient(id: int, patch: UpdatePatient, store: Store = Depends(get_store)):
 
-    # 2) get only the fields the user sent
+    # get only the fields the user sent
     changes = patch.model_dump(exclude_unset=True)   # only provided fields
+    expected_version = changes.pop('version', None)
     if not changes:
-        conn.close()
         raise HTTPException(status_code=400, detail="No fields provided to update")
 
-    # 3) build a Patient instance from existing DB values (map patient_id -> id)
-    patient_data = {
-        "id": existing["patient_id"],
-        "name": existing["name"],
-        "city": existing["city"],
-        "age": existing["age"],
-        "gender": existing["gender"],
-        "height": existing["height"],
-        "weight": existing["weight"],
-    }
-    existing_patient = Patient(**patient_data)
-
-    # 4) merge updates into the Patient model (validation applied)
-    merged_patient = existing_patient.model_copy(update=changes)
-
-    # 5) recompute computed fields
-    new_bmi = merged_patient.bmi
-    new_verdict = merged_patient.verdict
-
-    # 6) prepare parameterized UPDATE (only changed fields + bmi & verdict)
-    field_to_col = {
-        "name": "name",
-        "city": "city",
-        "age": "age",
-        "gender": "gender",
-        "height": "height",
-        "weight": "weight",
-    }
-
-    cols = []
-    params = []
-
-    for field, col in field_to_col.items():
-        if field in changes:
-            cols.append(f"{col} = ?")
-            params.append(getattr(merged_patient, field))
-
-    # always update bmi & verdict (depend on height/weight)
-    cols.append("bmi = ?")
-    params.append(new_bmi)
-    cols.append("verdict = ?")
-    params.append(new_verdict)
-
-    params.append(id)  # WHERE clause parameter
-
-    sql = f"UPDATE patients SET {', '.join(cols)} WHERE patient_id = ?"
-    cur.execute(sql, tuple(params))
-    conn.commit()
-
-    # 7) return updated row
-    cur.execute("SELECT * FROM patients WHERE patient_id = ?", (id,))
-    updated_row = dict(cur.fetchone())
-    conn.close()
+    updated_row = await store.write(repository.update_patient, id, changes, expected_version)
+    if updated_row is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    cache.invalidate([id])
+
     return JSONResponse(status_code=200, content={"message": "Patient updated", "patient": updated_row})
 
 # delete route
 @app.delete('/delete/{id}')
-def delete_patient(id : int = Path(..., description='ID of the patient in the DB', example='1')):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-                   SELECT * FROM patients 
-                   WHERE patient_id = ?
-                   """,(id,))
-    row = cursor.fetchone()
+async def delete_patient(id : int = Path(..., description='ID of the patient in the DB', example='1'), version: Optional[int] = Query(None, description='Only delete if the patient is still at this version'), store: Store = Depends(get_store)):
+    deleted = await store.write(repository.delete_patient, id, version)
     
-    if not row:
+    if not deleted:
         raise HTTPException(status_code=404, detail='Patient not found')
+    cache.invalidate([id])
     
-    
-    cursor.execute("""
-                   DELETE FROM patients 
-                   WHERE patient_id = ?
-                   """,(id,))
-    conn.commit()
-    conn.close()
-    return JSONResponse(status_code=200, content={'message': 'Patient deleted successfully'})
\ No newline at end of file
+    return JSONResponse(status_code=200, content={'message': 'Patient deleted successfully'})
@@ -0,0 +1,186 @@
+import sqlite3
+
+# versioned schema migrations, applied in order on startup. the version of a
+# database lives in PRAGMA user_version, so each step runs exactly once.
+# never edit a released step, append a new one instead
+
+def _stats_migration(dimensions):
+    # the same tables / trigger bodies for every dimension, spelled out once
+    def add(dim, row):
+        return f"""
+        insert into patient_group_stats(dimension, grp, patients, bmi_centi_sum)
+            values ('{dim}', {row}.{dim}, 1, cast(round({row}.bmi * 100) as integer))
+            on conflict(dimension, grp) do update set
+                patients = patients + 1, bmi_centi_sum = bmi_centi_sum + excluded.bmi_centi_sum;
+        insert into patient_bmi_counts(dimension, grp, bmi, patients)
+            values ('{dim}', {row}.{dim}, {row}.bmi, 1)
+            on conflict(dimension, grp, bmi) do update set patients = patients + 1;"""
+
+    def remove(dim, row):
+        return f"""
+        update patient_group_stats
+            set patients = patients - 1, bmi_centi_sum = bmi_centi_sum - cast(round({row}.bmi * 100) as integer)
+            where dimension = '{dim}' and grp = {row}.{dim};
+        delete from patient_group_stats where dimension = '{dim}' and grp = {row}.{dim} and patients = 0;
+        update patient_bmi_counts set patients = patients - 1
+            where dimension = '{dim}' and grp = {row}.{dim} and bmi = {row}.bmi;
+        delete from patient_bmi_counts
+            where dimension = '{dim}' and grp = {row}.{dim} and bmi = {row}.bmi and patients = 0;"""
+
+    watched = ', '.join(sorted({'bmi', *dimensions}))
+    backfill = ''.join(f"""
+    insert into patient_group_stats
+        select '{dim}', {dim}, count(*), sum(cast(round(bmi * 100) as integer)) from patients group by {dim};
+    insert into patient_bmi_counts
+        select '{dim}', {dim}, bmi, count(*) from patients group by {dim}, bmi;""" for dim in dimensions)
+    return f"""
+    create index if not exists ix_patients_gender on patients(gender, patient_id);
+    create table patient_group_stats(
+        dimension text not null,
+        grp text not null,
+        patients integer not null,
+        bmi_centi_sum integer not null,
+        primary key (dimension, grp)) without rowid;
+    create table patient_bmi_counts(
+        dimension text not null,
+        grp text not null,
+        bmi real not null,
+        patients integer not null,
+        primary key (dimension, grp, bmi)) without rowid;
+    {backfill}
+    create trigger patients_stats_insert after insert on patients begin
+        {''.join(add(dim, 'new') for dim in dimensions)}
+    end;
+    create trigger patients_stats_delete after delete on patients begin
+        {''.join(remove(dim, 'old') for dim in dimensions)}
+    end;
+    create trigger patients_stats_update after update of {watched} on patients
+    when {' or '.join(f'old.{c} is not new.{c}' for c in sorted({'bmi', *dimensions}))} begin
+        {''.join(remove(dim, 'old') for dim in dimensions)}
+        {''.join(add(dim, 'new') for dim in dimensions)}
+    end;
+    """
+
+
+STATS_MIGRATION = _stats_migration(['city', 'verdict'])
+
+MIGRATIONS = [
+    # 1: original table
+    """
+    create table if not exists patients(
+        patient_id int primary key,
+        name text not null,
+        city text not null,
+        age integer not null,
+        gender text not null check(gender in ('male', 'female', 'others')),
+        height real not null,
+        weight real not null,
+        bmi real not null,
+        verdict text not null);
+    """,
+    # 2: `int primary key` is not a rowid alias, so every lookup went through
+    # a separate autoindex and then the table. INTEGER PRIMARY KEY makes the
+    # table itself the patient_id B-tree
+    """
+    create table patients_v2(
+        patient_id integer primary key,
+        name text not null,
+        city text not null,
+        age integer not null,
+        gender text not null check(gender in ('male', 'female', 'others')),
+        height real not null,
+        weight real not null,
+        bmi real not null,
+        verdict text not null);
+    insert into patients_v2 select patient_id, name, city, age, gender, height, weight, bmi, verdict from patients;
+    drop table patients;
+    alter table patients_v2 rename to patients;
+    """,
+    # 3: indexes for /sort pages (already in (value, patient_id) order, so
+    # no temp B-tree) and for the city / verdict / age filters
+    """
+    create index if not exists ix_patients_height on patients(height, patient_id);
+    create index if not exists ix_patients_weight on patients(weight, patient_id);
+    create index if not exists ix_patients_bmi on patients(bmi, patient_id);
+    create index if not exists ix_patients_city on patients(city, patient_id);
+    create index if not exists ix_patients_verdict on patients(verdict, patient_id);
+    create index if not exists ix_patients_age on patients(age, patient_id);
+    """,
+    # 4: row version for optimistic concurrency, every update bumps it and
+    # a client that sends the version it read gets a conflict if it moved
+    """
+    alter table patients add column version integer not null default 1;
+    """,
+    # 5: summary tables for /patients/stats, kept current by triggers so the
+    # stats never scan patients. bmi is stored with 2 decimals, so it is
+    # summed as integer hundredths (no float drift from +/-) and the
+    # per-value counts in patient_bmi_counts give exact percentiles.
+    # plus the gender index for /patients/search
+    STATS_MIGRATION,
+    # 6: full-text index over name and city for /patients/search?q=. an
+    # external content table, so the text is stored once (in patients) and
+    # triggers keep the index in step with every write. prefix indexes make
+    # 2 and 3 letter prefix queries cheap, the vocab table lists the indexed
+    # terms for typo matching
+    """
+    create virtual table patients_fts using fts5(
+        name, city,
+        content='patients', content_rowid='patient_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3');
+    create virtual table patients_fts_vocab using fts5vocab(patients_fts, 'row');
+    insert into patients_fts(patients_fts) values ('rebuild');
+    create trigger patients_fts_insert after insert on patients begin
+        insert into patients_fts(rowid, name, city) values (new.patient_id, new.name, new.city);
+    end;
+    create trigger patients_fts_delete after delete on patients begin
+        insert into patients_fts(patients_fts, rowid, name, city) values ('delete', old.patient_id, old.name, old.city);
+    end;
+    create trigger patients_fts_update after update of name, city on patients
+    when old.name is not new.name or old.city is not new.city begin
+        insert into patients_fts(patients_fts, rowid, name, city) values ('delete', old.patient_id, old.name, old.city);
+        insert into patients_fts(rowid, name, city) values (new.patient_id, new.name, new.city);
+    end;
+    """,
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def statements(script):
+    # one statement at a time (triggers included), for conn.execute
+    pending = ''
+    for piece in script.split(';'):
+        pending += piece + ';'
+        if sqlite3.complete_statement(pending):
+            if pending.strip(' \n;'):
+                yield pending
+            pending = ''
+
+
+def migrate(conn):
+    # returns the list of versions that were applied. several processes can
+    # start on the same old database at once (uvicorn --workers): each step
+    # takes the write lock first (BEGIN IMMEDIATE) and re-reads the version
+    # under it, so a step another process just applied is skipped
+    applied = []
+    current = schema_version(conn)
+    if conn.in_transaction:
+        conn.commit()
+    for version, script in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = schema_version(conn)
+            if version > current:
+                for statement in statements(script):
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {version}')
+                applied.append(version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return applied
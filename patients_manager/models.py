@@ -0,0 +1,75 @@
+from pydantic import BaseModel, Field, computed_field, field_validator
+from typing import Annotated, Literal, Optional
+
+# plain helpers so bulk paths can derive bmi / verdict for a whole chunk
+# without going through the computed properties one attribute at a time
+def compute_bmi(height: float, weight: float) -> float:
+    return round(weight/(height**2),2)
+
+def bmi_verdict(bmi: float) -> str:
+    if bmi < 18.5:
+        return "Underweight"
+    elif bmi < 25:
+        return "Normal"
+    elif bmi < 30:
+        return "Overweight"
+    else:
+        return "Obese"
+
+#pydantic model for creating the patient
+class Patient(BaseModel):
+
+    id: Annotated[int, Field(..., description='ID of the patient', examples=['1'])]
+    name: Annotated[str, Field(..., description='Name of the patient')]
+    city: Annotated[str, Field(..., description='City where the patient is living')]
+    age: Annotated[int, Field(..., gt=0, lt=120, description='Age of the patient')]
+    gender: Annotated[Literal['male', 'female', 'others'], Field(..., description='Gender of the patient')]
+    height: Annotated[float, Field(..., gt=0, description='Height of the patient in mtrs')]
+    weight: Annotated[float, Field(..., gt=0, description='Weight of the patient in kgs')]
+
+    @computed_field
+    @property
+    def bmi(self) -> float:
+        return compute_bmi(self.height, self.weight)
+    
+    @computed_field
+    @property
+    def verdict(self) -> str:
+        return bmi_verdict(self.bmi)
+
+# pydantic model for updating the user info
+class UpdatePatient(BaseModel):
+    name: Annotated[Optional[str], Field(description='Name of the patient')] = None
+    city: Annotated[Optional[str], Field(description='City where the patient is living')] = None
+    age: Annotated[Optional[int], Field(gt=0, lt=120, description='Age of the patient')] = None
+    gender: Annotated[Optional[Literal['male', 'female', 'others']], Field(description='Gender of the patient')] = None
+    height: Annotated[Optional[float], Field(gt=0, description='Height of the patient in mtrs')] = None
+    weight: Annotated[Optional[float], Field(gt=0, description='Weight of the patient in kgs')] = None
+    version: Annotated[Optional[int], Field(description='Version the change is based on, the update fails with 409 if the patient changed since')] = None
+
+    # leaving a field out keeps it, an explicit null is not a value the
+    # patient can have
+    @field_validator('name', 'city', 'age', 'gender', 'height', 'weight', mode='before')
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError('may not be null')
+        return value
+
+# response shapes of the read routes, for the OpenAPI schema only: the
+# routes send rows.PatientRow objects serialized by rows.RowsResponse
+class PatientRecord(BaseModel):
+    patient_id: int
+    name: str
+    city: str
+    age: int
+    gender: str
+    height: float
+    weight: float
+    bmi: float
+    verdict: str
+    version: int
+
+class PatientPage(BaseModel):
+    items: list[PatientRecord]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,96 @@
+import base64
+import json
+import math
+import os
+from types import SimpleNamespace
+
+from rows import encode_chunk
+
+# keyset (seek) pagination: a cursor remembers the sort key of the last row
+# sent, the next page starts right after it using the index, so page N costs
+# the same as page 1 and nothing is ever OFFSET-skipped
+
+DEFAULT_PAGE_SIZE = int(os.getenv('PATIENTS_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.getenv('PATIENTS_MAX_PAGE_SIZE', '1000'))
+# rows fetched per round trip while streaming a full listing
+STREAM_CHUNK = int(os.getenv('PATIENTS_STREAM_CHUNK', '1000'))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_by, order, row):
+    # row is the last row of the page, sort_by None means patient_id order
+    key = [getattr(row, sort_by), row.patient_id] if sort_by else [row.patient_id]
+    raw = json.dumps({'s': sort_by, 'o': order, 'k': key}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _is_number(value):
+    return type(value) in (int, float) and math.isfinite(value)
+
+
+def decode_cursor(cursor, sort_by, order):
+    # returns the key tuple to seek after, a cursor only works for the
+    # listing (and direction) that produced it
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = data['k']
+        if data['s'] != sort_by or data['o'] != order:
+            raise InvalidCursor('cursor belongs to a different listing')
+        if not isinstance(key, list) or len(key) != (2 if sort_by else 1):
+            raise InvalidCursor('malformed cursor')
+        # the key goes to sqlite as query parameters: a patient_id, after
+        # the sorted column's (or the search rank's) number
+        *values, patient_id = key
+        if type(patient_id) is not int or not all(_is_number(value) for value in values):
+            raise InvalidCursor('malformed cursor')
+        return tuple(key)
+    except InvalidCursor:
+        raise
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor('malformed cursor') from e
+
+
+def page_body(rows, limit, sort_by=None, order='asc'):
+    # one extra row is fetched to know whether there is a next page
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(sort_by, order, rows[-1]) if has_more else None
+    return {'items': rows, 'next_cursor': next_cursor}
+
+
+def ranked_page_body(results, limit):
+    # results are (rank, row) pairs from a full-text search, the cursor
+    # continues after the last (rank, patient_id)
+    has_more = len(results) > limit
+    results = results[:limit]
+    next_cursor = None
+    if has_more:
+        rank, row = results[-1]
+        next_cursor = encode_cursor('rank', 'asc', SimpleNamespace(rank=rank, patient_id=row.patient_id))
+    return {'items': [row for _, row in results], 'next_cursor': next_cursor}
+
+
+async def stream_rows(store, fetch, *args, fmt='json', sort_by=None, order='asc'):
+    # walks the whole listing chunk by chunk, only one chunk is ever in
+    # memory. each chunk is its own short query, so a slow client never pins
+    # a connection (or a DB thread) for the length of the download
+    after = None
+    first = True
+    if fmt == 'json':
+        yield b'['
+    while True:
+        rows = await store.run(fetch, *args, after, STREAM_CHUNK)
+        if not rows:
+            break
+        yield encode_chunk(rows, fmt, first)
+        first = False
+        if len(rows) < STREAM_CHUNK:
+            break
+        last = rows[-1]
+        after = (getattr(last, sort_by), last.patient_id) if sort_by else (last.patient_id,)
+    if fmt == 'json':
+        yield b']'
@@ -0,0 +1,65 @@
+import sqlite3
+import sys
+
+import repository
+from migrations import migrate
+
+# EXPLAIN QUERY PLAN guard for the SQL behind each listing/lookup route.
+# a route is rejected if sqlite has to build a temp B-tree (sort everything
+# first) or, for lookups and seek pages, if it scans instead of searching.
+#
+#   python plancheck.py              # against a fresh in-memory schema
+#   python plancheck.py patients.db  # against a real (migrated) database
+
+
+def route_queries():
+    # (route, sql, params, must_search)
+    yield '/patient/{id}', repository.GET_SQL, (1,), True
+    yield '/view (first page)', repository.PAGE_SQL, (100,), False
+    yield '/view (next page)', repository.SEEK_PAGE_SQL, (1, 100), True
+    for sort_by in repository.SORTABLE_FIELDS:
+        for order in ['asc', 'desc']:
+            yield (f'/sort?sort_by={sort_by}&order={order} (first page)',
+                   repository.sorted_page_sql(sort_by, order, False), (100,), False)
+            yield (f'/sort?sort_by={sort_by}&order={order} (next page)',
+                   repository.sorted_page_sql(sort_by, order, True), (1.0, 1, 100), True)
+    for name in repository.SEARCH_EQUALS:
+        yield (f'/patients/search?{name}=...', repository.search_sql({name: 'x'}, True), ('x', 1, 100), True)
+    yield ('/patients/search?min_age=...&max_bmi=...',
+           repository.search_sql({'min_age': 1, 'max_bmi': 1.0}, True), (1, 1.0, 1, 100), True)
+    for group_by in repository.STATS_GROUPS:
+        yield (f'/patients/stats?group_by={group_by}', repository.GROUP_STATS_SQL,
+               (group_by, '[50, 90]', group_by), True)
+
+
+def explain(conn, sql, params):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def check(conn):
+    # returns a list of (route, plan) that fail the rules
+    failures = []
+    for route, sql, params, must_search in route_queries():
+        plan = explain(conn, sql, params)
+        sorts = any('TEMP B-TREE' in step for step in plan)
+        searches = any(step.startswith('SEARCH') for step in plan)
+        if sorts or (must_search and not searches):
+            failures.append((route, plan))
+    return failures
+
+
+def main(argv):
+    conn = sqlite3.connect(argv[1] if len(argv) > 1 else ':memory:')
+    migrate(conn)
+    failures = check(conn)
+    for route, plan in failures:
+        print(f'FAIL {route}')
+        for step in plan:
+            print(f'     {step}')
+    if not failures:
+        print('all route queries use an index, no full-table sorts')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,225 @@
+import json
+
+from models import Patient
+from rows import COLUMNS, SELECT_COLUMNS, patient_row
+
+# plain sync functions that take a connection as the first argument, the
+# store in db.py decides which thread (and which connection) runs them
+
+SORTABLE_FIELDS = ['height', 'weight', 'bmi']
+
+
+# the read paths build rows.PatientRow objects straight from the tuples,
+# so they name their columns instead of relying on SELECT * order
+PAGE_SQL = f'SELECT {SELECT_COLUMNS} FROM patients ORDER BY patient_id LIMIT ?'
+SEEK_PAGE_SQL = f'SELECT {SELECT_COLUMNS} FROM patients WHERE patient_id > ? ORDER BY patient_id LIMIT ?'
+GET_SQL = f'select {SELECT_COLUMNS} from patients where patient_id = ?'
+
+
+def sorted_page_sql(sort_by, order, seek):
+    # sort_by / order are validated by the route, never user text here.
+    # patient_id breaks ties so the (sort_by, patient_id) key is unique and
+    # a page boundary never skips or repeats rows with equal values. the
+    # ix_patients_<sort_by> index already has this order, so no sort step
+    op = '>' if order == 'asc' else '<'
+    where = f'WHERE ({sort_by}, patient_id) {op} (?, ?)' if seek else ''
+    return f"""
+            SELECT {SELECT_COLUMNS} FROM patients
+            {where}
+            ORDER BY {sort_by} {order}, patient_id {order}
+            LIMIT ?;
+            """
+
+
+def page_patients(conn, after, limit):
+    # after is None or (patient_id,) taken from the previous page
+    cursor = conn.cursor()
+    cursor.row_factory = patient_row
+    if after is None:
+        cursor.execute(PAGE_SQL, (limit,))
+    else:
+        cursor.execute(SEEK_PAGE_SQL, (*after, limit))
+    return cursor.fetchall()
+
+
+def get_patient(conn, patient_id):
+    cursor = conn.cursor()
+    cursor.row_factory = patient_row
+    cursor.execute(GET_SQL, (patient_id,))
+    return cursor.fetchall()
+
+
+def page_sorted(conn, sort_by, order, after, limit):
+    cursor = conn.cursor()
+    cursor.row_factory = patient_row
+    if after is None:
+        cursor.execute(sorted_page_sql(sort_by, order, False), (limit,))
+    else:
+        cursor.execute(sorted_page_sql(sort_by, order, True), (*after, limit))
+    return cursor.fetchall()
+
+
+def insert_patient(conn, patient: Patient):
+    # raises sqlite3.IntegrityError if the id is taken
+    cursor = conn.cursor()
+    cursor.execute('''INSERT INTO patients (patient_id, name, city, age, gender, height, weight,bmi, verdict) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', (patient.id, patient.name, patient.city, patient.age, patient.gender, patient.height, patient.weight, patient.bmi, patient.verdict))
+    conn.commit()
+
+
+class VersionConflict(Exception):
+    # the row changed since the client read it
+
+    def __init__(self, current_version):
+        super().__init__(f'patient is at version {current_version}')
+        self.current_version = current_version
+
+    # rebuilt from current_version when it comes back from the writer process
+    def __reduce__(self):
+        return type(self), (self.current_version,)
+
+
+UPDATABLE_FIELDS = ['name', 'city', 'age', 'gender', 'height', 'weight']
+# sqlite keeps whole-number REALs as integers on disk and RETURNING hands
+# them back without the conversion a SELECT does, so 70.0 would come out as 70
+RETURNING_COLUMNS = ', '.join(f'CAST({c} AS REAL) AS {c}' if c in ('height', 'weight', 'bmi') else c for c in COLUMNS)
+
+
+def update_sql(fields, check_version):
+    # columns left out keep their value. bmi / verdict are recomputed from
+    # the merged height and weight by the compute_bmi / bmi_verdict
+    # functions db.connect registers, so they match models.py exactly. the
+    # right-hand sides of SET see the row before the update
+    height = '?' if 'height' in fields else 'height'
+    weight = '?' if 'weight' in fields else 'weight'
+    sets = [f'{field} = ?' for field in fields]
+    sets.append(f'bmi = compute_bmi({height}, {weight})')
+    sets.append(f'verdict = bmi_verdict(compute_bmi({height}, {weight}))')
+    sets.append('version = version + 1')
+    where = 'patient_id = ? AND version = ?' if check_version else 'patient_id = ?'
+    return f'UPDATE patients SET {", ".join(sets)} WHERE {where} RETURNING {RETURNING_COLUMNS}'
+
+
+def current_version(conn, patient_id):
+    row = conn.execute('SELECT version FROM patients WHERE patient_id = ?', (patient_id,)).fetchone()
+    return row[0] if row else None
+
+
+def update_patient(conn, patient_id, changes, expected_version=None):
+    # one statement. changes are already validated field by field
+    # (UpdatePatient), and the rest of the row was valid, so the merged row
+    # is too. returns the updated row, None if the patient does not exist,
+    # raises VersionConflict if expected_version is given and stale
+    fields = [field for field in UPDATABLE_FIELDS if field in changes]
+    params = [changes[field] for field in fields]
+    if 'height' in changes or 'weight' in changes:
+        pair = [changes[f] for f in ('height', 'weight') if f in changes]
+        params += pair * 2
+    params.append(patient_id)
+    if expected_version is not None:
+        params.append(expected_version)
+
+    cursor = conn.execute(update_sql(fields, expected_version is not None), params)
+    row = cursor.fetchone()
+    conn.commit()
+    if row is not None:
+        return dict(row)
+    # only a failed write pays for the second query
+    version = current_version(conn, patient_id)
+    if version is not None:
+        raise VersionConflict(version)
+    return None
+
+
+def delete_patient(conn, patient_id, expected_version=None):
+    # returns False if there was nothing to delete, raises VersionConflict
+    # like update_patient
+    if expected_version is None:
+        cursor = conn.execute('DELETE FROM patients WHERE patient_id = ? RETURNING patient_id', (patient_id,))
+    else:
+        cursor = conn.execute('DELETE FROM patients WHERE patient_id = ? AND version = ? RETURNING patient_id',
+                              (patient_id, expected_version))
+    deleted = cursor.fetchone() is not None
+    conn.commit()
+    if deleted:
+        return True
+    version = current_version(conn, patient_id)
+    if version is not None:
+        raise VersionConflict(version)
+    return False
+
+
+# /patients/search: equality filters go through the (column, patient_id)
+# indexes, which already return matches in patient_id order for keyset paging
+SEARCH_EQUALS = ['city', 'gender', 'verdict']
+# query parameter -> condition
+SEARCH_RANGES = {
+    'min_age': 'age >= ?',
+    'max_age': 'age <= ?',
+    'min_bmi': 'bmi >= ?',
+    'max_bmi': 'bmi <= ?',
+}
+
+
+def search_conditions(filters, table=''):
+    # filters holds only the parameters that were given, names come from
+    # SEARCH_EQUALS / SEARCH_RANGES, never from the request
+    prefix = f'{table}.' if table else ''
+    conditions = [f'{prefix}{name} = ?' for name in SEARCH_EQUALS if name in filters]
+    conditions += [prefix + cond for name, cond in SEARCH_RANGES.items() if name in filters]
+    params = [filters[name] for name in SEARCH_EQUALS if name in filters]
+    params += [filters[name] for name in SEARCH_RANGES if name in filters]
+    return conditions, params
+
+
+def search_sql(filters, seek):
+    conditions, _ = search_conditions(filters)
+    if seek:
+        conditions.append('patient_id > ?')
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'SELECT {SELECT_COLUMNS} FROM patients {where} ORDER BY patient_id LIMIT ?'
+
+
+def search_patients(conn, filters, after, limit):
+    _, params = search_conditions(filters)
+    if after is not None:
+        params.extend(after)
+    params.append(limit)
+    cursor = conn.cursor()
+    cursor.row_factory = patient_row
+    cursor.execute(search_sql(filters, after is not None), params)
+    return cursor.fetchall()
+
+
+STATS_GROUPS = ['city', 'verdict']
+
+# reads only the summary tables from migration 5, so the cost follows the
+# number of groups (and distinct bmi values in them), not the patients.
+# percentiles are nearest-rank: the smallest bmi with at least
+# ceil(p / 100 * n) patients at or below it
+GROUP_STATS_SQL = """
+    WITH running AS MATERIALIZED (
+        SELECT grp, bmi,
+               sum(patients) OVER (PARTITION BY grp ORDER BY bmi ROWS UNBOUNDED PRECEDING) AS upto
+        FROM patient_bmi_counts
+        WHERE dimension = ?
+    )
+    SELECT g.grp, g.patients, g.bmi_centi_sum, p.value,
+           (SELECT min(r.bmi) FROM running r
+            WHERE r.grp = g.grp AND r.upto * 100 >= p.value * g.patients)
+    FROM patient_group_stats g LEFT JOIN json_each(?) p
+    WHERE g.dimension = ?
+"""
+
+
+def group_stats(conn, group_by, percentiles):
+    # [{'group', 'count', 'mean_bmi', 'p<N>_bmi', ...}] sorted by group
+    groups = {}
+    for grp, patients, centi_sum, pct, value in conn.execute(
+            GROUP_STATS_SQL, (group_by, json.dumps(percentiles), group_by)):
+        entry = groups.get(grp)
+        if entry is None:
+            entry = groups[grp] = {'group': grp, 'count': patients,
+                                   'mean_bmi': round(centi_sum / patients / 100, 2)}
+        if pct is not None:
+            entry[f'p{pct:g}_bmi'] = value
+    return sorted(groups.values(), key=lambda entry: entry['group'])
@@ -0,0 +1,77 @@
+import dataclasses
+import json
+import os
+
+from fastapi.responses import Response
+
+# fast path for the listing routes: sqlite hands each row to patient_row,
+# which makes a slotted PatientRow straight from the tuple, and orjson
+# serializes those natively in C. no dict per row, no jsonable_encoder walk
+# and no response_model validation. orjson is optional (pip install orjson),
+# without it the stdlib json module writes the same bytes, only slower
+
+# orjson | json
+JSON_LIB = os.getenv('PATIENTS_JSON', 'orjson')
+
+orjson = None
+if JSON_LIB == 'orjson':
+    try:
+        import orjson
+    except ImportError:
+        pass
+
+
+@dataclasses.dataclass(slots=True)
+class PatientRow:
+    patient_id: int
+    name: str
+    city: str
+    age: int
+    gender: str
+    height: float
+    weight: float
+    bmi: float
+    verdict: str
+    version: int
+
+
+COLUMNS = tuple(f.name for f in dataclasses.fields(PatientRow))
+# listing queries select exactly these, in this order
+SELECT_COLUMNS = ', '.join(COLUMNS)
+
+
+def patient_row(cursor, row):
+    return PatientRow(*row)
+
+
+def _as_dict(obj):
+    if isinstance(obj, PatientRow):
+        return {c: getattr(obj, c) for c in COLUMNS}
+    raise TypeError(f'{type(obj).__name__} is not JSON serializable')
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_as_dict, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def encode_chunk(rows, fmt, first):
+    # one chunk of a streamed listing, as the bytes between '[' and ']' for
+    # json or one line per row for ndjson
+    body = dumps(rows)[1:-1]
+    if fmt == 'ndjson':
+        # one dumps call for the chunk, then a newline between rows. a '"'
+        # inside a string is always escaped, so '},{"' only occurs where one
+        # row object ends and the next begins (rows have no nested objects)
+        return body.replace(b'},{"', b'}\n{"') + b'\n' if body else b''
+    return body if first else b',' + body
+
+
+class RowsResponse(Response):
+    # the routes still declare response_model for the OpenAPI schema, but a
+    # Response returned as is skips FastAPI's validation and encoding
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,65 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+# runs the API in several worker processes on one port:
+#
+#   python serve.py --workers 4 --port 8000
+#
+# the parent migrates the database, starts the writer process (writer.py)
+# and forks the workers. every worker reads through its own connection
+# pool, writes go to the one writer, and the cache generation counters sit
+# in a shared file so a write in one worker invalidates every worker's
+# cached copies (PATIENTS_CACHE_SHARED, set here unless already given).
+# the snapshot exporter (snapshot.py) gets a process of its own instead of
+# a thread in every worker
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from prefork import Supervisor, serve
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve the patients API with several worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--log-level', default='info')
+    parser.add_argument('--snapshot-interval', type=float,
+                        default=float(os.getenv('PATIENTS_SNAPSHOT_INTERVAL', '60')),
+                        help='seconds between snapshot change checks, 0 = no exporter')
+    args = parser.parse_args(argv)
+
+    # private to this user, the writer socket accepts pickles
+    runtime = tempfile.mkdtemp(prefix='patients-serve-')
+    address = os.path.join(runtime, 'writer.sock')
+    key = os.urandom(16)
+    # read at import by db.py / cache.py, so set before main is imported
+    os.environ['PATIENTS_DB_WRITER'] = address
+    os.environ['PATIENTS_DB_WRITER_KEY'] = key.hex()
+    os.environ.setdefault('PATIENTS_CACHE_SHARED', os.path.join(runtime, 'cache-generations'))
+
+    try:
+        import db
+        import main as api
+        import snapshot
+        import writer
+
+        api.init_db()
+        # no sqlite connection may cross the fork
+        api.pool.close()
+
+        supervisor = Supervisor()
+        supervisor.start('writer', lambda: writer.serve(address, key, db.DB_PATH))
+        if args.snapshot_interval > 0:
+            supervisor.start('snapshot', snapshot.Exporter(interval=args.snapshot_interval).run)
+        # inherited by the workers, their startup leaves it off
+        snapshot.exporter.interval = 0
+        serve(api.app, args.workers, args.host, args.port, supervisor=supervisor, log_level=args.log_level)
+    finally:
+        shutil.rmtree(runtime, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
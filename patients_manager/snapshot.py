@@ -0,0 +1,224 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+from db import DB_PATH, connect
+from rows import COLUMNS, SELECT_COLUMNS, PatientRow, encode_chunk
+
+# full exports of the patients table for bulk consumers, served as plain
+# files by GET /patients/snapshot so a full dump never touches the live
+# database and nothing is serialized per request.
+#
+# an export reads the whole table in one read transaction (a consistent
+# point in time, WAL keeps writers going meanwhile) and writes gzipped
+# NDJSON, plus Parquet when pyarrow is installed. files get a new name per
+# export and are never modified, then manifest.json is swapped in with an
+# atomic rename; a request that already opened the previous files keeps
+# reading them. the exporter checks for changes every interval with
+# PRAGMA data_version, which moves whenever another connection (any
+# process) commits, so an idle database is not exported again.
+#
+# an export costs a full table read (seconds of CPU per million rows), so
+# an API process does not run the exporter unless asked to: serve.py runs
+# it in a process of its own, PATIENTS_SNAPSHOT_INTERVAL=60 turns it on in
+# a plain `uvicorn main:app` (once per machine, not in every worker)
+#
+#   python snapshot.py    # one export now, e.g. from cron
+
+SNAPSHOT_DIR = os.getenv('PATIENTS_SNAPSHOT_DIR', 'snapshots')
+# seconds between change checks in the API process, 0 (the default) = off
+SNAPSHOT_INTERVAL = float(os.getenv('PATIENTS_SNAPSHOT_INTERVAL', '0'))
+GZIP_LEVEL = int(os.getenv('PATIENTS_SNAPSHOT_GZIP_LEVEL', '6'))
+# rows read, encoded and written at a time (one parquet row group each)
+CHUNK_ROWS = 50_000
+# exports kept on disk, older ones are deleted after a new one is live
+KEEP = 2
+MANIFEST = 'manifest.json'
+
+class ExportCancelled(Exception):
+    pass
+
+
+MEDIA_TYPES = {'ndjson': 'application/gzip', 'parquet': 'application/vnd.apache.parquet'}
+EXTENSIONS = {'ndjson': 'ndjson.gz', 'parquet': 'parquet'}
+
+
+def _parquet_schema():
+    # None when the optional pyarrow is missing, the export is NDJSON only
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    types = {int: pa.int64(), str: pa.string(), float: pa.float64()}
+    return pa.schema([(name, types[kind]) for name, kind in PatientRow.__annotations__.items()])
+
+
+def export(conn, directory=SNAPSHOT_DIR, stopping=None):
+    # writes one export and makes it current, returns its manifest. once the
+    # stopping event is set it gives up between chunks (ExportCancelled)
+    os.makedirs(directory, exist_ok=True)
+    name = f'patients-{time.time_ns()}'
+    started = time.perf_counter()
+    schema = _parquet_schema()
+    files = {fmt: f'{name}.{EXTENSIONS[fmt]}' for fmt in (('ndjson', 'parquet') if schema else ('ndjson',))}
+    paths = {fmt: os.path.join(directory, file) for fmt, file in files.items()}
+
+    rows = 0
+    parquet = None
+    ndjson = gzip.open(paths['ndjson'] + '.tmp', 'wb', compresslevel=GZIP_LEVEL)
+    try:
+        if schema:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            parquet = pq.ParquetWriter(paths['parquet'] + '.tmp', schema, compression='zstd')
+        conn.execute('BEGIN')
+        try:
+            cursor = conn.execute(f'SELECT {SELECT_COLUMNS} FROM patients ORDER BY patient_id')
+            while batch := cursor.fetchmany(CHUNK_ROWS):
+                if stopping is not None and stopping.is_set():
+                    raise ExportCancelled('stopped during an export')
+                ndjson.write(encode_chunk([PatientRow(*row) for row in batch], 'ndjson', rows == 0))
+                if parquet:
+                    columns = list(zip(*batch))
+                    parquet.write_table(pa.table(dict(zip(COLUMNS, columns)), schema=schema))
+                rows += len(batch)
+        finally:
+            conn.rollback()
+    except BaseException:
+        ndjson.close()
+        if parquet:
+            parquet.close()
+        for path in paths.values():
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+        raise
+    ndjson.close()
+    if parquet:
+        parquet.close()
+
+    for path in paths.values():
+        os.replace(path + '.tmp', path)
+    manifest = {
+        'name': name,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'rows': rows,
+        'seconds': round(time.perf_counter() - started, 3),
+        'files': {fmt: {'file': file, 'bytes': os.path.getsize(paths[fmt])} for fmt, file in files.items()},
+    }
+    tmp = os.path.join(directory, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+    prune(directory)
+    return manifest
+
+
+def prune(directory, keep=KEEP):
+    exports = sorted({f.split('.', 1)[0] for f in os.listdir(directory)
+                      if f.startswith('patients-') and not f.endswith('.tmp')})
+    for name in exports[:-keep]:
+        for ext in EXTENSIONS.values():
+            path = os.path.join(directory, f'{name}.{ext}')
+            if os.path.exists(path):
+                os.remove(path)
+
+
+_current = (None, None)
+
+
+def current(directory=SNAPSHOT_DIR):
+    # the live manifest, re-read only when manifest.json was replaced
+    global _current
+    path = os.path.join(directory, MANIFEST)
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached_stamp, manifest = _current
+    if stamp != cached_stamp:
+        with open(path) as f:
+            manifest = json.load(f)
+        _current = (stamp, manifest)
+    return manifest
+
+
+class Exporter:
+
+    def __init__(self, path=DB_PATH, directory=SNAPSHOT_DIR, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.directory = directory
+        self.interval = interval
+        self._conn = None
+        self._exported_version = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self.exports = 0
+        self.unchanged = 0
+        self.last = None
+        self.last_error = None
+
+    def export_if_changed(self):
+        if self._conn is None:
+            self._conn = connect(self.path)
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._exported_version and current(self.directory) is not None:
+            self.unchanged += 1
+            return None
+        self.last = export(self._conn, self.directory, self._stopping)
+        self._exported_version = version
+        self.exports += 1
+        return self.last
+
+    def run(self):
+        # blocking loop, the body of the background thread or of a
+        # dedicated process (serve.py). with an export already on disk the
+        # first check waits an interval, so a restart does not spend its
+        # first seconds re-exporting a table that probably did not change
+        if current(self.directory) is not None:
+            self._stopping.wait(self.interval)
+        while not self._stopping.is_set():
+            try:
+                self.export_if_changed()
+                self.last_error = None
+            except ExportCancelled:
+                break
+            except Exception as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+            self._stopping.wait(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run, name='patients-snapshot', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self):
+        return {
+            'interval_s': self.interval,
+            'running': self._thread is not None,
+            'exports': self.exports,
+            'unchanged': self.unchanged,
+            'last': self.last,
+            'last_error': self.last_error,
+            # what is being served, also in processes that do not export
+            'current': current(self.directory),
+        }
+
+
+exporter = Exporter()
+
+
+if __name__ == '__main__':
+    manifest = export(connect())
+    print(f"exported {manifest['rows']:,} rows in {manifest['seconds']}s to {SNAPSHOT_DIR}/{manifest['name']}.*")
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the app's modules import each other as top level modules (from models
+# import ...), the tests run from any directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# read at import by db.py / snapshot.py / cache.py: the app under test gets
+# a throwaway database, patients.db is never touched
+RUNTIME = tempfile.mkdtemp(prefix='patients-tests-')
+os.environ['PATIENTS_DB'] = os.path.join(RUNTIME, 'patients.db')
+os.environ['PATIENTS_SNAPSHOT_DIR'] = os.path.join(RUNTIME, 'snapshots')
+os.environ['PATIENTS_SNAPSHOT_INTERVAL'] = '0'
+os.environ.pop('PATIENTS_CACHE_SHARED', None)
+os.environ.pop('PATIENTS_DB_WRITER', None)
+
+
+@pytest.fixture(scope='session')
+def client():
+    # one app (and database) for the whole run, tests use patient ids of
+    # their own so they do not see each other's rows
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+def patient(patient_id, **fields):
+    return {'id': patient_id, 'name': 'Asha Rao', 'city': 'Pune', 'age': 30, 'gender': 'female',
+            'height': 1.6, 'weight': 60, **fields}
@@ -0,0 +1,43 @@
+import json
+
+from conftest import patient
+
+NDJSON = {'content-type': 'application/x-ndjson'}
+
+
+def test_json_array_report(client):
+    assert client.post('/create', json=patient(500)).status_code == 201
+    body = [patient(501), patient(502, age=0), patient(500), {'id': 503}, patient(504)]
+    response = client.post('/patients/bulk', json=body)
+    assert response.status_code == 201
+    report = response.json()
+    assert (report['received'], report['inserted'], report['failed']) == (5, 2, 3)
+    assert sorted(error['row'] for error in report['errors']) == [1, 2, 3]
+    assert not report['errors_truncated']
+    assert client.get('/patient/504').status_code == 200
+
+
+def test_ndjson_report(client):
+    lines = [
+        json.dumps(patient(510)).encode(),
+        b'{"id": 511, "name": ',
+        b'',
+        # latin-1, not utf-8: reported for its line, the rest still loads
+        json.dumps(patient(512, name='José'), ensure_ascii=False).encode('latin-1'),
+        json.dumps(patient(513, name='José Iyer'), ensure_ascii=False).encode(),
+    ]
+    response = client.post('/patients/bulk', content=b'\n'.join(lines), headers=NDJSON)
+    assert response.status_code == 201
+    report = response.json()
+    assert (report['received'], report['inserted'], report['failed']) == (4, 2, 2)
+    errors = {error['row']: error['detail'] for error in report['errors']}
+    assert errors[1].startswith('invalid JSON')
+    assert errors[3].startswith('invalid UTF-8')
+    assert client.get('/patient/513').json()[0]['name'] == 'José Iyer'
+    assert client.get('/patient/512').status_code == 404
+
+
+def test_unreadable_array_is_a_bad_request(client):
+    for body in [b'[{"id": 1', b'{"id": 1}', b'[\xff]']:
+        response = client.post('/patients/bulk', content=body, headers={'content-type': 'application/json'})
+        assert response.status_code == 400
@@ -0,0 +1,102 @@
+import json
+import multiprocessing
+import time
+
+import pytest
+
+from cache import PatientCache
+from conftest import patient
+
+
+def conditional_get(client, path, etag):
+    return client.get(path, headers={'If-None-Match': etag})
+
+
+def test_edit_changes_etag_and_body(client):
+    assert client.post('/create', json=patient(200, weight=60)).status_code == 201
+    first = client.get('/patient/200')
+    etag = first.headers['etag']
+    assert conditional_get(client, '/patient/200', etag).status_code == 304
+
+    assert client.put('/edit/200', json={'weight': 75}).status_code == 200
+    response = conditional_get(client, '/patient/200', etag)
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    assert response.json()[0]['weight'] == 75
+    assert conditional_get(client, '/patient/200', response.headers['etag']).status_code == 304
+
+
+def test_delete_drops_cached_patient(client):
+    assert client.post('/create', json=patient(201)).status_code == 201
+    etag = client.get('/patient/201').headers['etag']
+    assert client.delete('/delete/201').status_code == 200
+    assert conditional_get(client, '/patient/201', etag).status_code == 404
+
+
+def listing(client):
+    # the first full listing streams and fills the cache, the second one is
+    # served from it with an ETag
+    client.get('/view')
+    response = client.get('/view')
+    return response.headers['etag'], response.json()
+
+
+def test_writes_refresh_the_listing(client):
+    assert client.post('/create', json=patient(210)).status_code == 201
+    etag, rows = listing(client)
+    assert conditional_get(client, '/view', etag).status_code == 304
+
+    body = ''.join(json.dumps(patient(i)) + '\n' for i in (211, 212))
+    response = client.post('/patients/bulk', content=body, headers={'content-type': 'application/x-ndjson'})
+    assert response.json()['inserted'] == 2
+    response = conditional_get(client, '/view', etag)
+    assert response.status_code == 200
+    ids = {row['patient_id'] for row in response.json()}
+    assert {211, 212} <= ids and not {211, 212} & {row['patient_id'] for row in rows}
+
+    etag, _ = listing(client)
+    assert client.put('/edit/210', json={'city': 'Indore'}).status_code == 200
+    response = conditional_get(client, '/view', etag)
+    assert response.status_code == 200
+    assert next(row for row in response.json() if row['patient_id'] == 210)['city'] == 'Indore'
+
+    etag, _ = listing(client)
+    assert client.delete('/delete/210').status_code == 200
+    response = conditional_get(client, '/view', etag)
+    assert response.status_code == 200
+    assert 210 not in {row['patient_id'] for row in response.json()}
+
+
+def invalidate(path, patient_id):
+    PatientCache(shared_path=path, slots=64).invalidate([patient_id])
+
+
+# the worker only bumps counters, the test client's threads do not matter
+@pytest.mark.filterwarnings('ignore:This process .* is multi-threaded')
+def test_shared_generations_across_processes(tmp_path):
+    # the counters serve.py puts in a file: a write in another (forked)
+    # worker makes this worker's entry stale
+    path = str(tmp_path / 'generations')
+    cache = PatientCache(shared_path=path, slots=64)
+    cache.put_patient(7, cache.patient_stamp(7), b'[{"id":7}]')
+    cache.put_patient(8, cache.patient_stamp(8), b'[{"id":8}]')
+    assert cache.get_patient(7) is not None
+    worker = multiprocessing.get_context('fork').Process(target=invalidate, args=(path, 7))
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+    assert cache.get_patient(7) is None
+    assert cache.get_patient(8) is not None
+    assert cache.stats()['stale'] == 1
+
+
+def test_local_entries_expire():
+    # without shared counters another process's writes are invisible, the
+    # ttl bounds how long such a stale entry is served
+    cache = PatientCache(ttl=0.05)
+    cache.put_patient(7, cache.patient_stamp(7), b'[{"id":7}]')
+    assert cache.get_patient(7) is not None
+    time.sleep(0.1)
+    assert cache.get_patient(7) is None
+    assert cache.stats()['expired'] == 1
+    assert PatientCache(shared_path='', ttl=0).ttl == 0
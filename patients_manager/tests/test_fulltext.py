@@ -0,0 +1,114 @@
+import pytest
+
+import fulltext
+import repository
+from conftest import patient
+from db import connect
+from migrations import migrate
+from models import Patient
+
+PEOPLE = [
+    (1, 'Priya Sharma', 'Pune'),
+    (2, 'Rahul Sharma', 'Mumbai'),
+    (3, 'José Zyxwen', 'Delhi'),
+    (4, 'Indore Shah', 'Pune'),
+    (5, 'Asha Rao', 'Indore'),
+    (6, 'Priya Iyer', 'Mumbai'),
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'patients.db'))
+    migrate(conn)
+    for patient_id, name, city in PEOPLE:
+        repository.insert_patient(conn, Patient(**patient(patient_id, name=name, city=city)))
+    yield conn
+    conn.close()
+
+
+def found(conn, q, filters=None):
+    return [row.patient_id for _, row in fulltext.search(conn, q, filters or {}, None, 100)]
+
+
+def in_vocab(conn, term):
+    return conn.execute('SELECT 1 FROM patients_fts_vocab WHERE term = ?', (term,)).fetchone() is not None
+
+
+def test_prefix_and_all_words(conn):
+    assert sorted(found(conn, 'sha')) == [1, 2, 4]
+    assert found(conn, 'priya sharma') == [1]
+    assert found(conn, 'PRIYA mumbai') == [6]
+    assert found(conn, 'priya delhi') == []
+    assert found(conn, 'jose') == [3]
+    assert found(conn, 'priya', {'city': 'Mumbai'}) == [6]
+
+
+def test_typos(conn):
+    assert sorted(found(conn, 'sharam')) == [1, 2]  # swap
+    assert sorted(found(conn, 'sharmma')) == [1, 2]  # insert
+    assert found(conn, 'zyxwan') == [3]  # replace
+    assert found(conn, 'priya sharm') == [1]  # a prefix, no typo needed
+    # short words are only prefix matched
+    assert found(conn, 'rso') == []
+
+
+def test_name_hits_rank_above_city_hits(conn):
+    assert found(conn, 'indore') == [4, 5]
+
+
+def test_index_follows_edits_and_deletes(conn):
+    repository.update_patient(conn, 3, {'name': 'Jose Quixley'})
+    assert found(conn, 'zyxwen') == []
+    assert not in_vocab(conn, 'zyxwen')
+    assert found(conn, 'quixley') == [3]
+
+    repository.update_patient(conn, 1, {'city': 'Jaipur'})
+    assert found(conn, 'priya pune') == []
+    assert found(conn, 'priya jaipur') == [1]
+    # an edit that does not touch name or city leaves the index alone
+    repository.update_patient(conn, 1, {'weight': 80.0})
+    assert found(conn, 'priya jaipur') == [1]
+
+    repository.delete_patient(conn, 3)
+    assert found(conn, 'quixley') == []
+    assert not in_vocab(conn, 'quixley')
+    assert in_vocab(conn, 'jaipur')
+    repository.delete_patient(conn, 1)
+    assert not in_vocab(conn, 'jaipur')
+
+
+def test_ranked_pages(conn):
+    for patient_id in range(10, 40):
+        # the extra words change the document lengths, so bm25 varies
+        name = 'Meera Kapoor' + ' Devi' * (patient_id % 4)
+        repository.insert_patient(conn, Patient(**patient(patient_id, name=name, city='Surat')))
+    everything = fulltext.search(conn, 'kapoor', {}, None, 100)
+    assert len(everything) == 30
+    pages, after = [], None
+    while True:
+        page = fulltext.search(conn, 'kapoor', {}, after, 4)
+        pages += page
+        if len(page) < 4:
+            break
+        rank, row = page[-1]
+        after = (rank, row.patient_id)
+    assert [row.patient_id for _, row in pages] == [row.patient_id for _, row in everything]
+
+
+def test_search_pages_over_http(client):
+    for patient_id in range(400, 411):
+        assert client.post('/create', json=patient(patient_id, name='Kavya Quenby' + ' Devi' * (patient_id % 3),
+                                                   city='Surat' if patient_id % 2 else 'Pune')).status_code == 201
+    for params in [{'q': 'quenby'}, {'q': 'qunby', 'city': 'Surat'}]:
+        everything = client.get('/patients/search', params={**params, 'limit': 100}).json()['items']
+        assert everything
+        seen, cursor = [], None
+        while True:
+            paging = {'limit': 3, 'cursor': cursor} if cursor else {'limit': 3}
+            page = client.get('/patients/search', params={**params, **paging}).json()
+            seen += page['items']
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        assert [row['patient_id'] for row in seen] == [row['patient_id'] for row in everything]
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+import ingest
+import repository
+from db import connect
+from migrations import migrate
+from models import Patient
+
+CITIES = ['Pune', 'Mumbai', 'Delhi', 'Indore']
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'patients.db'))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def new_patient(patient_id, rng):
+    return Patient(id=patient_id, name='Asha Rao', city=rng.choice(CITIES), age=rng.randint(1, 119),
+                   gender='female', height=round(rng.uniform(1.4, 2.0), 2), weight=round(rng.uniform(40, 130), 1))
+
+
+def stored(conn):
+    groups = {(dim, grp): (patients, centi) for dim, grp, patients, centi in
+              conn.execute('SELECT dimension, grp, patients, bmi_centi_sum FROM patient_group_stats')}
+    counts = {(dim, grp, bmi): patients for dim, grp, bmi, patients in
+              conn.execute('SELECT dimension, grp, bmi, patients FROM patient_bmi_counts')}
+    return groups, counts
+
+
+def recomputed(conn):
+    # what the trigger maintained tables should hold, from scratch
+    groups, counts = {}, {}
+    for dim in ('city', 'verdict'):
+        for grp, patients, centi in conn.execute(
+                f'SELECT {dim}, count(*), sum(cast(round(bmi * 100) as integer)) FROM patients GROUP BY {dim}'):
+            groups[dim, grp] = (patients, centi)
+        for grp, bmi, patients in conn.execute(f'SELECT {dim}, bmi, count(*) FROM patients GROUP BY {dim}, bmi'):
+            counts[dim, grp, bmi] = patients
+    return groups, counts
+
+
+def test_triggers_match_a_full_recount(conn):
+    rng = random.Random(3)
+    for patient_id in range(1, 41):
+        repository.insert_patient(conn, new_patient(patient_id, rng))
+    assert stored(conn) == recomputed(conn)
+
+    ingest.write_chunk(conn, [(row, new_patient(patient_id, rng)) for row, patient_id in enumerate(range(41, 141))])
+    assert stored(conn) == recomputed(conn)
+
+    for patient_id in rng.sample(range(1, 141), 60):
+        changes = rng.choice([
+            {'weight': round(rng.uniform(40, 130), 1)},  # bmi and mostly verdict
+            {'height': 1.5, 'weight': 56.25},  # right on the Overweight threshold (bmi 25)
+            {'city': rng.choice(CITIES)},  # city group, maybe the same one
+            {'name': 'Ravi Rao'},  # not a stats column, trigger does not fire
+            {'city': 'Surat', 'weight': 55.0},
+        ])
+        repository.update_patient(conn, patient_id, changes)
+    assert stored(conn) == recomputed(conn)
+
+    for patient_id in rng.sample(range(1, 141), 50):
+        repository.delete_patient(conn, patient_id)
+    assert stored(conn) == recomputed(conn)
+    # groups that lost their last patient are gone, not left at zero
+    assert all(patients > 0 for patients, _ in stored(conn)[0].values())
+
+    total = sum(group['count'] for group in repository.group_stats(conn, 'city', [50]))
+    assert total == conn.execute('SELECT count(*) FROM patients').fetchone()[0]
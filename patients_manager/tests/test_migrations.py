@@ -0,0 +1,35 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import plancheck
+from migrations import MIGRATIONS, migrate, schema_version
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+
+def test_migrate_is_a_no_op_when_current(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'patients.db')
+    assert migrate(conn) == list(range(1, len(MIGRATIONS) + 1))
+    assert migrate(conn) == []
+    conn.close()
+
+
+def test_concurrent_migrate_applies_each_step_once(tmp_path):
+    # like the workers of `uvicorn --workers N` starting on a fresh database
+    path = str(tmp_path / 'patients.db')
+    script = ('import json, sys, db, migrations; '
+              'print(json.dumps(migrations.migrate(db.connect(sys.argv[1]))))')
+    procs = [subprocess.Popen([sys.executable, '-c', script, path], cwd=APP, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True) for _ in range(8)]
+    outputs = [proc.communicate(timeout=60) for proc in procs]
+    assert [proc.returncode for proc in procs] == [0] * len(procs), [err for _, err in outputs]
+    # every step was applied by exactly one of them
+    applied = sorted(version for out, _ in outputs for version in json.loads(out))
+    assert applied == list(range(1, len(MIGRATIONS) + 1))
+    conn = sqlite3.connect(path)
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert plancheck.check(conn) == []
+    conn.close()
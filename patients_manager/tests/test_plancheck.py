@@ -0,0 +1,12 @@
+import sqlite3
+
+import plancheck
+from migrations import MIGRATIONS, migrate, schema_version
+
+
+def test_route_queries_use_indexes(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'patients.db')
+    migrate(conn)
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert plancheck.check(conn) == []
+    conn.close()
@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import snapshot
+from migrations import migrate
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'patients.db')
+    migrate(conn)
+    conn.executemany('INSERT INTO patients (patient_id, name, city, age, gender, height, weight, bmi, verdict) '
+                     "VALUES (?, 'Asha Rao', 'Pune', 30, 'female', 1.6, 60, 23.44, 'Normal')",
+                     [(i,) for i in range(1, 251)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_export(conn, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, 'CHUNK_ROWS', 100)
+    directory = str(tmp_path / 'snapshots')
+    manifest = snapshot.export(conn, directory)
+    assert manifest['rows'] == 250
+    assert snapshot.current(directory)['name'] == manifest['name']
+
+
+def test_stopped_export_leaves_nothing_behind(conn, tmp_path):
+    directory = str(tmp_path / 'snapshots')
+    stopping = threading.Event()
+    stopping.set()
+    with pytest.raises(snapshot.ExportCancelled):
+        snapshot.export(conn, directory, stopping)
+    assert os.listdir(directory) == []
+    assert snapshot.current(directory) is None
+
+
+def test_exporter_is_off_by_default():
+    exporter = snapshot.Exporter()
+    exporter.start()
+    assert exporter.stats()['running'] is False
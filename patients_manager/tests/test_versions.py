@@ -0,0 +1,69 @@
+import dataclasses
+
+import pytest
+
+import repository
+from conftest import patient
+from db import connect
+from migrations import migrate
+from models import bmi_verdict, compute_bmi
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'patients.db'))
+    migrate(conn)
+    conn.execute('INSERT INTO patients (patient_id, name, city, age, gender, height, weight, bmi, verdict) '
+                 "VALUES (1, 'Asha Rao', 'Pune', 30, 'female', 1.6, 60, 23.44, 'Normal')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_update_returns_the_new_row(conn):
+    # UPDATE ... RETURNING: the merged row, bmi / verdict derived in sql
+    row = repository.update_patient(conn, 1, {'weight': 90.0})
+    assert row['weight'] == 90.0
+    assert row['bmi'] == compute_bmi(1.6, 90.0)
+    assert row['verdict'] == bmi_verdict(row['bmi'])
+    assert row['version'] == 2
+    assert dataclasses.asdict(repository.get_patient(conn, 1)[0]) == row
+
+
+def test_update_with_version(conn):
+    assert repository.update_patient(conn, 1, {'city': 'Indore'}, expected_version=1)['version'] == 2
+    with pytest.raises(repository.VersionConflict) as conflict:
+        repository.update_patient(conn, 1, {'city': 'Surat'}, expected_version=1)
+    assert conflict.value.current_version == 2
+    assert repository.get_patient(conn, 1)[0].city == 'Indore'
+    assert repository.update_patient(conn, 2, {'city': 'Surat'}, expected_version=1) is None
+
+
+def test_delete_with_version(conn):
+    repository.update_patient(conn, 1, {'age': 31})
+    with pytest.raises(repository.VersionConflict):
+        repository.delete_patient(conn, 1, expected_version=1)
+    assert repository.delete_patient(conn, 1, expected_version=2)
+    assert not repository.delete_patient(conn, 1, expected_version=2)
+
+
+def test_edit_and_delete_over_http(client):
+    assert client.post('/create', json=patient(300)).status_code == 201
+    assert client.get('/patient/300').json()[0]['version'] == 1
+
+    response = client.put('/edit/300', json={'weight': 70, 'version': 1})
+    assert response.status_code == 200
+    assert response.json()['patient']['version'] == 2
+
+    # a client still holding version 1
+    response = client.put('/edit/300', json={'weight': 80, 'version': 1})
+    assert response.status_code == 409
+    assert response.json()['version'] == 2
+    assert client.get('/patient/300').json()[0]['weight'] == 70
+
+    # no version: last write wins, still bumps it
+    assert client.put('/edit/300', json={'weight': 80}).json()['patient']['version'] == 3
+
+    assert client.delete('/delete/300', params={'version': 2}).status_code == 409
+    assert client.delete('/delete/300', params={'version': 3}).status_code == 200
+    assert client.put('/edit/300', json={'weight': 70, 'version': 3}).status_code == 404
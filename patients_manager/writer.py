@@ -0,0 +1,133 @@
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from starlette.concurrency import run_in_threadpool
+
+# single writer for multi-process serving (serve.py). sqlite allows one
+# write transaction at a time per database file; with several worker
+# processes each holding its own connections, concurrent writes collide on
+# that lock and spin through busy_timeout. here one process owns the only
+# connection that writes, the workers send it (fn, args) over a unix socket
+# and get back the return value or the exception. reads never come here,
+# WAL lets them run in every worker next to the writer.
+#
+# fn is pickled by reference (module + name), the writer is forked from the
+# same code as the workers. the socket lives in a private directory and the
+# handshake needs the key, unpickling what arrives runs code
+
+
+def serve(address, authkey, path):
+    # the writer process: a thread per worker connection, one lock around
+    # the shared sqlite connection so statements run strictly one at a time
+    from db import connect
+
+    conn = connect(path)
+    lock = threading.Lock()
+
+    def handle(client):
+        with client:
+            while True:
+                try:
+                    fn, args = client.recv()
+                except EOFError:
+                    return
+                with lock:
+                    try:
+                        reply = (True, fn(conn, *args))
+                    except Exception as exc:
+                        if conn.in_transaction:
+                            conn.rollback()
+                        reply = (False, exc)
+                client.send(reply)
+
+    # left behind by a writer that crashed, this one replaces it
+    if os.path.exists(address):
+        os.unlink(address)
+    with Listener(address, 'AF_UNIX', authkey=authkey) as listener:
+        while True:
+            client = listener.accept()
+            threading.Thread(target=handle, args=(client,), daemon=True).start()
+
+
+class WriterClient:
+    # worker side. one socket per concurrent write, kept for reuse
+
+    def __init__(self, address, authkey, timeout=30):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._failures = 0
+        self._time = 0.0
+        self._max_time = 0.0
+
+    def _connect(self):
+        # the writer may still be starting (or restarting) when the first
+        # write arrives
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return Client(self.address, 'AF_UNIX', authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def call(self, fn, args):
+        start = time.perf_counter()
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            client = self._connect()
+        try:
+            client.send((fn, args))
+            ok, value = client.recv()
+        except BaseException:
+            # the reply may still be on its way, this socket is out of step
+            client.close()
+            with self._lock:
+                self._failures += 1
+            raise
+        self._idle.put(client)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._calls += 1
+            self._time += elapsed
+            self._max_time = max(self._max_time, elapsed)
+        if ok:
+            return value
+        raise value
+
+    async def run(self, fn, *args):
+        return await run_in_threadpool(self.call, fn, args)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                'address': self.address,
+                'calls': self._calls,
+                'failures': self._failures,
+                'connections_idle': self._idle.qsize(),
+                'time_total_s': round(self._time, 6),
+                'time_max_s': round(self._max_time, 6),
+            }
+
+
+def from_env():
+    # set by serve.py for its workers
+    address = os.getenv('PATIENTS_DB_WRITER')
+    if not address:
+        return None
+    return WriterClient(address, bytes.fromhex(os.environ['PATIENTS_DB_WRITER_KEY']))
@@ -0,0 +1,9 @@
+# pre-fork process supervisor shared by the serve.py launchers of
+# patients_manager and serving_model: the parent sets up whatever should be
+# shared (a loaded model, a migrated database), binds the listening socket
+# once, then forks uvicorn workers that all accept on it. linux / macos only
+# (os.fork)
+
+from .supervisor import Supervisor, listen, serve, uvicorn_worker
+
+__all__ = ['Supervisor', 'listen', 'serve', 'uvicorn_worker']
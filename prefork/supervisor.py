@@ -0,0 +1,112 @@
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# a child that exits sooner than this after starting is restarted only
+# after the same delay, so a worker that cannot start doesn't spin
+RESTART_BACKOFF = 1.0
+
+
+def listen(host, port, backlog=2048):
+    # bound in the parent and inherited by every worker, the kernel spreads
+    # the accepted connections between them
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def uvicorn_worker(app, sock, log_level='info', **config):
+    # target for Supervisor.start: runs the app (lifespan included) on the
+    # inherited socket until SIGTERM
+    def run():
+        import uvicorn
+
+        server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, **config))
+        server.run(sockets=[sock])
+    return run
+
+
+class Supervisor:
+    # forks named children, restarts the ones that die, and on SIGTERM /
+    # SIGINT stops them all and returns
+
+    def __init__(self):
+        self._targets = {}
+        self._children = {}
+        self._stopping = False
+
+    def start(self, name, target):
+        self._targets[name] = target
+        self._fork(name)
+
+    def _fork(self, name):
+        pid = os.fork()
+        if pid == 0:
+            # own process group: a ctrl-c in the terminal reaches only the
+            # parent, which then stops the children one SIGTERM each
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 1
+            try:
+                self._targets[name]()
+                status = 0
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        self._children[pid] = (name, time.monotonic())
+        return pid
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            name, started = self._children.pop(pid, (None, 0))
+            if name is None or self._stopping:
+                continue
+            print(f'[prefork] {name} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, '
+                  'restarting', file=sys.stderr, flush=True)
+            if time.monotonic() - started < RESTART_BACKOFF:
+                time.sleep(RESTART_BACKOFF)
+            if not self._stopping:
+                self._fork(name)
+
+
+def serve(app, workers, host='127.0.0.1', port=8000, supervisor=None, log_level='info'):
+    # forks `workers` uvicorn processes on one shared socket and supervises
+    # them (plus anything already started on `supervisor`) until stopped.
+    # everything the parent allocated so far is frozen out of the garbage
+    # collector first: a collection in a worker would otherwise write to the
+    # header of every shared object and copy its page
+    supervisor = supervisor or Supervisor()
+    sock = listen(host, port)
+    gc.collect()
+    gc.freeze()
+    for i in range(workers):
+        supervisor.start(f'worker-{i}', uvicorn_worker(app, sock, log_level))
+    print(f'[prefork] {workers} workers on http://{host}:{port} (pid {os.getpid()})', file=sys.stderr, flush=True)
+    supervisor.run()
+    sock.close()
@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# inference backends behind the registry. the sklearn pipeline is the
+# reference; the onnx backend converts the whole pipeline (one-hot encoding
+# included) with skl2onnx once per load and runs it with onnxruntime on CPU,
+# which skips pandas/sklearn overhead on every call. onnx is only used when
+# the optional packages are installed, the conversion works and it gives the
+# same labels as sklearn on a sample, otherwise the sklearn pipeline serves.
+#
+# a converted graph that passed that check is cached next to the artifact
+# (<artifact>.onnx and <artifact>.onnx.json), keyed by the artifact's hash
+# and the converter versions. a restart then builds the session straight
+# from the file: no unpickling, no sklearn or skl2onnx import, no
+# conversion, which is most of the time a worker takes to become ready.
+#
+#   python backends.py bench [models/model.pkl]
+
+# sklearn | onnx
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'onnx')
+# rows compared between sklearn and the converted model after each load
+EQUIVALENCE_ROWS = int(os.getenv('MODEL_EQUIVALENCE_ROWS', '2000'))
+# MODEL_ONNX_CACHE=0 converts on every load and writes nothing
+MODEL_ONNX_CACHE = os.getenv('MODEL_ONNX_CACHE', '1') == '1'
+
+# graph input types <-> numpy dtypes, for the cache metadata
+DTYPES = {'double': np.float64, 'int64': np.int64, 'string': object}
+
+
+class SklearnBackend:
+    name = 'sklearn'
+
+    def __init__(self, model):
+        self.model = model
+        self.classes = tuple(model.classes_.tolist())
+
+    def predict(self, frame: pd.DataFrame) -> list:
+        return self.model.predict(frame).tolist()
+
+    def predict_proba(self, frame: pd.DataFrame):
+        # (labels, probabilities rows x classes) from one pass. the label is
+        # the most probable class, which is exactly what predict() returns
+        # for the forest (and the trees / linear models) it is built for
+        probabilities = self.model.predict_proba(frame)
+        return self.model.classes_.take(probabilities.argmax(axis=1)).tolist(), probabilities
+
+
+class OnnxBackend:
+    name = 'onnx'
+
+    def __init__(self, session, columns, classes, graph=None):
+        self.session = session
+        # the serialized model, kept only until it is written to the cache
+        self.graph = graph
+        # (column, numpy dtype) in the order the graph expects
+        self.columns = columns
+        # probability columns are in this order
+        self.classes = classes
+        # first output is the label, second the class probabilities
+        outputs = session.get_outputs()
+        self.label_output = outputs[0].name
+        self.proba_output = outputs[1].name
+
+    @classmethod
+    def from_sklearn(cls, model, sample: pd.DataFrame):
+        from skl2onnx import convert_sklearn
+        from skl2onnx.common.data_types import DoubleTensorType, Int64TensorType, StringTensorType
+        import onnxruntime as ort
+
+        initial_types = []
+        columns = []
+        for column, dtype in sample.dtypes.items():
+            # doubles, not floats, so split thresholds compare exactly like sklearn
+            if pd.api.types.is_float_dtype(dtype):
+                initial_types.append((column, DoubleTensorType([None, 1])))
+                columns.append((column, np.float64))
+            elif pd.api.types.is_integer_dtype(dtype):
+                initial_types.append((column, Int64TensorType([None, 1])))
+                columns.append((column, np.int64))
+            else:
+                initial_types.append((column, StringTensorType([None, 1])))
+                columns.append((column, object))
+
+        # zipmap off: probabilities come back as one array, not a list of dicts
+        options = {id(model.steps[-1][1]): {'zipmap': False}} if hasattr(model, 'steps') else {'zipmap': False}
+        onx = convert_sklearn(model, initial_types=initial_types, options=options,
+                              target_opset={'': 17, 'ai.onnx.ml': 3})
+        graph = onx.SerializeToString()
+        session = ort.InferenceSession(graph, providers=['CPUExecutionProvider'])
+        return cls(session, columns, tuple(model.classes_.tolist()), graph)
+
+    @classmethod
+    def from_cache(cls, meta, graph_path):
+        import onnxruntime as ort
+
+        session = ort.InferenceSession(graph_path, providers=['CPUExecutionProvider'])
+        return cls(session, [(column, DTYPES[kind]) for column, kind in meta['columns']], tuple(meta['classes']))
+
+    def _feeds(self, frame):
+        return {column: frame[column].to_numpy(dtype).reshape(-1, 1) for column, dtype in self.columns}
+
+    def predict(self, frame: pd.DataFrame) -> list:
+        labels = self.session.run([self.label_output], self._feeds(frame))[0]
+        return labels.tolist()
+
+    def predict_proba(self, frame: pd.DataFrame):
+        # both outputs come from the same tree ensemble node, one run
+        labels, probabilities = self.session.run([self.label_output, self.proba_output], self._feeds(frame))
+        return labels.tolist(), probabilities
+
+
+def sample_frame(rows=EQUIVALENCE_ROWS, seed=0):
+    # realistic model inputs, including values sitting on the feature thresholds
+    import features
+    import parity
+    return features.engineer(features.from_inputs(parity.random_inputs(rows, seed)))
+
+
+def cache_key(path):
+    # what a cached graph was converted from: the artifact bytes and the
+    # library versions that unpickled and converted it (read from package
+    # metadata, nothing gets imported)
+    from importlib.metadata import version
+
+    with open(path, 'rb') as f:
+        digest = hashlib.file_digest(f, 'sha256').hexdigest()
+    return {'artifact_sha256': digest, 'scikit-learn': version('scikit-learn'), 'skl2onnx': version('skl2onnx'),
+            'equivalence_rows': EQUIVALENCE_ROWS}
+
+
+def cached_meta(path):
+    # the cache metadata when <path>.onnx holds the conversion of this very
+    # artifact, None otherwise (or when onnx / the cache is off)
+    if MODEL_BACKEND != 'onnx' or not MODEL_ONNX_CACHE:
+        return None
+    try:
+        with open(path + '.onnx.json') as f:
+            meta = json.load(f)
+        if meta['key'] != cache_key(path) or not os.path.exists(path + '.onnx'):
+            return None
+    except Exception:
+        return None  # missing, unreadable or from another layout: convert again
+    return meta
+
+
+def cached_backend(path):
+    # (backend, info) built from the cache, or None on a miss
+    meta = cached_meta(path)
+    if meta is None:
+        return None
+    try:
+        backend = OnnxBackend.from_cache(meta, path + '.onnx')
+    except Exception:
+        return None
+    return backend, {**meta['info'], 'onnx_cache': 'hit'}
+
+
+def write_cache(path, backend, info):
+    meta = {'key': cache_key(path), 'info': info, 'classes': list(backend.classes),
+            'columns': [(column, next(k for k, t in DTYPES.items() if t is dtype)) for column, dtype in backend.columns]}
+    for target, data, mode in ((path + '.onnx', backend.graph, 'wb'), (path + '.onnx.json', json.dumps(meta, indent=2), 'w')):
+        with open(target + '.tmp', mode) as f:
+            f.write(data)
+        os.replace(target + '.tmp', target)
+
+
+def build_backend(model, kind=MODEL_BACKEND, cache_path=None):
+    # returns (backend, info) where info says why that backend was picked.
+    # with cache_path (the artifact) an onnx backend is written to the cache
+    reference = SklearnBackend(model)
+    if kind == 'sklearn':
+        return reference, {'backend': 'sklearn', 'requested': kind}
+    try:
+        sample = sample_frame()
+        backend = OnnxBackend.from_sklearn(model, sample)
+        mismatches = sum(a != b for a, b in zip(reference.predict(sample), backend.predict(sample)))
+        # onnx computes probabilities in float32, reported not enforced
+        proba_diff = float(np.abs(reference.predict_proba(sample)[1] - backend.predict_proba(sample)[1]).max())
+    except Exception as e:
+        return reference, {'backend': 'sklearn', 'requested': kind,
+                           'fallback_reason': f'{type(e).__name__}: {e}'}
+    info = {'backend': 'onnx', 'requested': kind, 'equivalence_rows': len(sample),
+            'equivalence_mismatches': mismatches, 'equivalence_max_probability_diff': proba_diff}
+    if mismatches:
+        info.update(backend='sklearn', fallback_reason=f'{mismatches} of {len(sample)} labels differ from sklearn')
+        return reference, info
+    if cache_path and MODEL_ONNX_CACHE:
+        try:
+            write_cache(cache_path, backend, info)
+            info = {**info, 'onnx_cache': 'written'}
+        except Exception as e:
+            # a read-only models directory only costs the next start a conversion
+            info = {**info, 'onnx_cache': f'not written: {type(e).__name__}: {e}'}
+    backend.graph = None
+    return backend, info
+
+
+def bench(args):
+    from registry import load_artifact
+
+    model = load_artifact(args.path, mmap=False)
+    backends = [SklearnBackend(model)]
+    onnx, info = build_backend(model, 'onnx')
+    if onnx.name == 'onnx':
+        backends.append(onnx)
+    else:
+        print(f"onnx unavailable: {info.get('fallback_reason')}")
+
+    frame = sample_frame(max(args.batch, 1), seed=1)
+    for backend in backends:
+        for rows in (1, args.batch):
+            batch = frame.iloc[:rows]
+            backend.predict(batch)
+            repeat = max(3, args.repeat if rows == 1 else args.repeat // 10)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                backend.predict(batch)
+            per_call = (time.perf_counter() - start) / repeat
+            start = time.perf_counter()
+            for _ in range(repeat):
+                backend.predict_proba(batch)
+            proba_per_call = (time.perf_counter() - start) / repeat
+            print(f'{backend.name:<8} rows={rows:<6} {per_call * 1000:9.3f} ms/call  '
+                  f'{per_call / rows * 1e6:9.2f} us/row  with probabilities {proba_per_call * 1000:9.3f} ms/call')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='inference backend tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('bench', help='single-row and batch latency per backend, labels only and with probabilities')
+    b.add_argument('path', nargs='?', default=os.getenv(
+        'MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'model.pkl')))
+    b.add_argument('--batch', type=int, default=1000)
+    b.add_argument('--repeat', type=int, default=200)
+    b.set_defaults(func=bench)
+    args = parser.parse_args()
+    sys.exit(args.func(args))
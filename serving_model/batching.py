@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from observability import REGISTRY
+
+# /predict request coalescing: concurrent callers drop their feature row in a
+# queue, one loop gathers whatever arrives within the window (or until the
+# batch is full), builds a single DataFrame and runs one vectorized predict
+# in a worker thread, then hands every caller its own result. the batch
+# asks for class probabilities only when one of its callers wants them
+
+BATCH_WINDOW_MS = float(os.getenv('PREDICT_BATCH_WINDOW_MS', '2'))
+MAX_BATCH_SIZE = int(os.getenv('PREDICT_MAX_BATCH_SIZE', '64'))
+
+# shared by every batcher, labelled with the model role it batches for
+batch_size = REGISTRY.histogram('predict_batch_size', 'Rows per micro-batch', ('role',),
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+queue_wait = REGISTRY.histogram('predict_batch_queue_wait_seconds', 'Time a row waits for its micro-batch', ('role',),
+                                buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+inference_time = REGISTRY.histogram('predict_batch_inference_seconds', 'Time to predict one micro-batch', ('role',),
+                                    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5))
+
+
+class MicroBatcher:
+
+    def __init__(self, predict, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE, role='primary'):
+        # predict(frame, probabilities) returns one result per row, a label
+        # or with probabilities a (label, ...) tuple
+        self.predict = predict
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._task = None
+        self.batch_size = batch_size.labels(role)
+        self.queue_wait = queue_wait.labels(role)
+        self.inference_time = inference_time.labels(role)
+
+    def start(self):
+        # needs a running loop, call from the app startup
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def submit(self, row, probabilities=False):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future, time.perf_counter(), probabilities))
+        return await future
+
+    async def _collect(self):
+        # block for the first request, then keep taking until the window
+        # closes or the batch is full
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            # whatever is already queued costs nothing to add
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            # callers that went away (client disconnect) are dropped here
+            batch = [item for item in batch if not item[1].cancelled()]
+            if not batch:
+                continue
+            for _, _, queued_at, _ in batch:
+                self.queue_wait.observe(started - queued_at)
+            self.batch_size.observe(len(batch))
+
+            frame = pd.DataFrame([row for row, _, _, _ in batch])
+            probabilities = any(item[3] for item in batch)
+            try:
+                results = await asyncio.to_thread(self.predict, frame, probabilities)
+            except Exception as exc:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            finally:
+                self.inference_time.observe(time.perf_counter() - started)
+
+            for (_, future, _, wanted), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result if wanted or not probabilities else result[0])
+
+    def stats(self):
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch_size': self.max_batch_size,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'batch_size': self.batch_size.snapshot(),
+            'queue_wait_seconds': self.queue_wait.snapshot(),
+            'inference_seconds': self.inference_time.snapshot(),
+        }
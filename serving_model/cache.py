@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# in-process cache of /predict results. the key is the model input (not the
+# raw request), so different users that end up with the same feature row
+# share an entry. bmi and income can be bucketed to raise the hit rate, at
+# the price of answering with the prediction for a nearby value
+
+CACHE_SIZE = int(os.getenv('PREDICT_CACHE_SIZE', '10000'))
+CACHE_TTL = float(os.getenv('PREDICT_CACHE_TTL', '300'))
+# bucket width, 0 keeps the exact value
+BMI_QUANTUM = float(os.getenv('PREDICT_CACHE_BMI_QUANTUM', '0'))
+INCOME_QUANTUM = float(os.getenv('PREDICT_CACHE_INCOME_QUANTUM', '0'))
+
+
+def quantize(value, quantum):
+    return round(value / quantum) if quantum else value
+
+
+class PredictionCache:
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, bmi_quantum=BMI_QUANTUM, income_quantum=INCOME_QUANTUM):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.bmi_quantum = bmi_quantum
+        self.income_quantum = income_quantum
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # whatever identifies the model that produced the cached values
+        self._model_token = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def key(self, row):
+        # row is the model input dict built by main.model_input
+        return (
+            quantize(row['bmi'], self.bmi_quantum),
+            row['age_group'],
+            row['lifestyle_risk'],
+            row['city_tier'],
+            quantize(row['income_lpa'], self.income_quantum),
+            row['occupation'],
+        )
+
+    def _check_model(self, model_token):
+        # caller holds the lock. a new model (or version) drops everything
+        if model_token != self._model_token:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._model_token = model_token
+
+    def get(self, key, model_token):
+        # returns (hit, value)
+        now = time.monotonic()
+        with self._lock:
+            self._check_model(model_token)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value, model_token):
+        with self._lock:
+            # computed by a model that has been replaced since the lookup
+            if model_token != self._model_token:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'bmi_quantum': self.bmi_quantum,
+                'income_quantum': self.income_quantum,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
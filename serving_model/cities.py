@@ -0,0 +1,59 @@
+import json
+import os
+from functools import lru_cache
+from types import MappingProxyType
+
+# city -> tier, read once from a data file (CITY_TIERS_PATH, by default
+# data/city_tiers.json: {"<tier>": ["City", ...]}) so adding a city is a
+# data change. cities are stored the way normalize() spells them, anything
+# not listed is OTHER_TIER
+
+CITY_TIERS_PATH = os.getenv('CITY_TIERS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'city_tiers.json'))
+# distinct unlisted spellings whose normalized form is remembered
+NORMALIZE_CACHE_SIZE = int(os.getenv('CITY_NORMALIZE_CACHE_SIZE', '4096'))
+OTHER_TIER = 3
+
+
+def load_tiers(path=CITY_TIERS_PATH):
+    with open(path) as f:
+        data = json.load(f)
+    tiers = {}
+    for tier, names in data.items():
+        for name in names:
+            if name != name.strip().title():
+                raise ValueError(f'{path}: {name!r} should be written {name.strip().title()!r}')
+            if name in tiers:
+                raise ValueError(f'{path}: {name!r} is listed in tier {tiers[name]} and tier {tier}')
+            tiers[name] = int(tier)
+    return MappingProxyType(tiers)
+
+
+CITY_TIERS = load_tiers()
+
+
+def cities_in_tier(tier):
+    return [name for name, t in CITY_TIERS.items() if t == tier]
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize(value):
+    return value.strip().title()
+
+
+def normalize(value: str) -> str:
+    # a listed city sent in its usual spelling is already normalized, that
+    # is one dict lookup. everything else goes through the LRU
+    if value in CITY_TIERS:
+        return value
+    return _normalize(value)
+
+
+def tier(city: str) -> int:
+    # city as returned by normalize()
+    return CITY_TIERS.get(city, OTHER_TIER)
+
+
+def stats():
+    info = _normalize.cache_info()
+    return {'listed': len(CITY_TIERS), 'path': CITY_TIERS_PATH,
+            'normalize_cache': {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}}
@@ -0,0 +1,123 @@
+import io
+import typing
+
+import numpy as np
+import pandas as pd
+
+import cities
+from schema import UserInput
+
+# column-wise version of the UserInput computed fields, for scoring many rows
+# at once. every rule here must match schema.UserInput exactly, parity.py
+# checks that
+
+RAW_COLUMNS = ['age', 'weight', 'height', 'income_lpa', 'smoker', 'city', 'occupation']
+FEATURE_COLUMNS = ['bmi', 'age_group', 'lifestyle_risk', 'city_tier', 'income_lpa', 'occupation']
+OCCUPATIONS = list(typing.get_args(UserInput.model_fields['occupation'].annotation))
+
+# content types accepted by /predict/batch besides a JSON array
+CSV = 'text/csv'
+ARROW = 'application/vnd.apache.arrow.stream'
+ARROW_FILE = 'application/vnd.apache.arrow.file'
+PARQUET = 'application/vnd.apache.parquet'
+UPLOAD_TYPES = [CSV, ARROW, ARROW_FILE, PARQUET]
+
+# the city index as a Series, so a whole column is looked up in one map()
+CITY_TIERS = pd.Series(dict(cities.CITY_TIERS), dtype=np.int64)
+
+
+class InvalidBatch(ValueError):
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid rows')
+        self.errors = errors
+
+
+def engineer(raw: pd.DataFrame) -> pd.DataFrame:
+    # raw has RAW_COLUMNS (already validated), returns the model input
+    age = raw['age'].to_numpy()
+    smoker = raw['smoker'].to_numpy(dtype=bool)
+    height = raw['height'].to_numpy(dtype=float)
+    # float_power goes through libm pow() like python's `**`, plain `** 2`
+    # is squared by multiplication and can differ in the last bit
+    bmi = raw['weight'].to_numpy(dtype=float) / np.float_power(height, 2)
+
+    lifestyle_risk = np.select(
+        [smoker & (bmi > 30), smoker | (bmi > 27)], ['high', 'medium'], 'low')
+    age_group = np.select(
+        [age < 25, age < 45, age < 60], ['young', 'adult', 'middle_aged'], 'senior')
+
+    city = raw['city'].astype(str).str.strip().str.title()
+    city_tier = city.map(CITY_TIERS).fillna(cities.OTHER_TIER).to_numpy(dtype=np.int64)
+
+    return pd.DataFrame({
+        'bmi': bmi,
+        'age_group': age_group.astype(object),
+        'lifestyle_risk': lifestyle_risk.astype(object),
+        'city_tier': city_tier,
+        'income_lpa': raw['income_lpa'].to_numpy(dtype=float),
+        'occupation': raw['occupation'].to_numpy(dtype=object),
+    }, columns=FEATURE_COLUMNS)
+
+
+def from_inputs(inputs: list[UserInput]) -> pd.DataFrame:
+    # already validated models, only the raw fields are read so no computed
+    # property runs per object
+    return pd.DataFrame(
+        [(i.age, i.weight, i.height, i.income_lpa, i.smoker, i.city, i.occupation) for i in inputs],
+        columns=RAW_COLUMNS)
+
+
+def validate_frame(raw: pd.DataFrame) -> pd.DataFrame:
+    # the UserInput constraints, checked a column at a time for uploads.
+    # raises InvalidBatch with per-row messages, returns a clean copy
+    missing = [c for c in RAW_COLUMNS if c not in raw.columns]
+    if missing:
+        raise InvalidBatch([{'row': None, 'detail': f'missing columns: {missing}'}])
+    raw = raw[RAW_COLUMNS].copy()
+
+    numeric = {c: pd.to_numeric(raw[c], errors='coerce') for c in ['age', 'weight', 'height', 'income_lpa']}
+    smoker = raw['smoker']
+    if smoker.dtype != bool:
+        smoker = smoker.astype(str).str.strip().str.lower().map(
+            {'true': True, '1': True, 'yes': True, 'false': False, '0': False, 'no': False})
+
+    checks = {
+        'age must be an integer with 0 < age < 120':
+            ~((numeric['age'] > 0) & (numeric['age'] < 120) & (numeric['age'] % 1 == 0)),
+        'weight must be > 0': ~(numeric['weight'] > 0),
+        'height must be 0 < height < 2.5': ~((numeric['height'] > 0) & (numeric['height'] < 2.5)),
+        'income_lpa must be > 0': ~(numeric['income_lpa'] > 0),
+        'smoker must be a boolean': smoker.isna(),
+        'city must be a string': raw['city'].isna(),
+        f'occupation must be one of {OCCUPATIONS}': ~raw['occupation'].isin(OCCUPATIONS),
+    }
+    errors = []
+    for message, bad in checks.items():
+        for row in np.flatnonzero(bad.to_numpy()):
+            errors.append({'row': int(row), 'detail': message})
+    if errors:
+        errors.sort(key=lambda e: e['row'])
+        raise InvalidBatch(errors)
+
+    raw['age'] = numeric['age'].astype(int)
+    for c in ['weight', 'height', 'income_lpa']:
+        raw[c] = numeric[c].astype(float)
+    raw['smoker'] = smoker.astype(bool)
+    return raw.reset_index(drop=True)
+
+
+def read_upload(body: bytes, content_type: str) -> pd.DataFrame:
+    if content_type == CSV:
+        # round_trip: the default fast parser can be off by one ulp, which
+        # moves a bmi sitting on a threshold
+        return pd.read_csv(io.BytesIO(body), float_precision='round_trip')
+    if content_type == PARQUET:
+        return pd.read_parquet(io.BytesIO(body))
+    # arrow needs the optional pyarrow package (parquet does too)
+    import pyarrow as pa
+    if content_type == ARROW:
+        return pa.ipc.open_stream(body).read_all().to_pandas()
+    if content_type == ARROW_FILE:
+        return pa.ipc.open_file(pa.BufferReader(body)).read_all().to_pandas()
+    raise ValueError(f'unsupported content type {content_type}')
@@ -30,11 +30,12 @@ if st.button("Predict Premium Category"):
     }
 
     try:
-        response = requests.post(API_URL, json=input_data)
+        # probabilities=true adds confidence and class_probabilities
+        response = requests.post(API_URL, params={"probabilities": "true"}, json=input_data)
         result = response.json()
 
-        if response.status_code == 200 and "response" in result:
-            prediction = result["response"]
+        if response.status_code == 200 and "predicted_category" in result:
+            prediction = result
             st.success(f"Predicted Insurance Premium Category: **{prediction['predicted_category']}**")
             st.write("🔍 Confidence:", prediction["confidence"])
             st.write("📊 Class Probabilities:")
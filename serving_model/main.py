@@ -1,109 +1,304 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Body, Query
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, computed_field, field_validator
-from typing import Literal, Annotated
-import pickle
+from pydantic import TypeAdapter, ValidationError
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
+import os
+import sys
+import time
 import pandas as pd
 
-# import the ml model
-with open('./models/model.pkl', 'rb') as f:
-    model = pickle.load(f)
-
-# but in real world we extract it from MLFlow
-MODEL_VERSION = '1.0.0'
-app = FastAPI()
-
-tier_1_cities = ["Mumbai", "Delhi", "Bangalore", "Chennai", "Kolkata", "Hyderabad", "Pune"]
-tier_2_cities = [
-    "Jaipur", "Chandigarh", "Indore", "Lucknow", "Patna", "Ranchi", "Visakhapatnam", "Coimbatore",
-    "Bhopal", "Nagpur", "Vadodara", "Surat", "Rajkot", "Jodhpur", "Raipur", "Amritsar", "Varanasi",
-    "Agra", "Dehradun", "Mysore", "Jabalpur", "Guwahati", "Thiruvananthapuram", "Ludhiana", "Nashik",
-    "Allahabad", "Udaipur", "Aurangabad", "Hubli", "Belgaum", "Salem", "Vijayawada", "Tiruchirappalli",
-    "Bhavnagar", "Gwalior", "Dhanbad", "Bareilly", "Aligarh", "Gaya", "Kozhikode", "Warangal",
-    "Kolhapur", "Bilaspur", "Jalandhar", "Noida", "Guntur", "Asansol", "Siliguri"
-]
-
-# pydantic model to validate incoming data
-class UserInput(BaseModel):
-
-    age: Annotated[int, Field(..., gt=0, lt=120, description='Age of the user')]
-    weight: Annotated[float, Field(..., gt=0, description='Weight of the user')]
-    height: Annotated[float, Field(..., gt=0, lt=2.5, description='Height of the user')]
-    income_lpa: Annotated[float, Field(..., gt=0, description='Annual salary of the user in lpa')]
-    smoker: Annotated[bool, Field(..., description='Is user a smoker')]
-    city: Annotated[str, Field(..., description='The city that the user belongs to')]
-    occupation: Annotated[Literal['retired', 'freelancer', 'student', 'government_job',
-       'business_owner', 'unemployed', 'private_job'], Field(..., description='Occupation of the user')]
-    
-    @field_validator('city')
-    @classmethod
-    def normalize_city(cls, value:str) -> str:
-        value = value.strip().title()
-        return value
-    
-    @computed_field
-    @property
-    def bmi(self) -> float:
-        return self.weight/(self.height**2)
-    
-    @computed_field
-    @property
-    def lifestyle_risk(self) -> str:
-        if self.smoker and self.bmi > 30:
-            return "high"
-        elif self.smoker or self.bmi > 27:
-            return "medium"
-        else:
-            return "low"
-        
-    @computed_field
-    @property
-    def age_group(self) -> str:
-        if self.age < 25:
-            return "young"
-        elif self.age < 45:
-            return "adult"
-        elif self.age < 60:
-            return "middle_aged"
-        return "senior"
-    
-    @computed_field
-    @property
-    def city_tier(self) -> int:
-        if self.city in tier_1_cities:
-            return 1
-        elif self.city in tier_2_cities:
-            return 2
-        else:
-            return 3
+from batching import MicroBatcher
+from cache import PredictionCache
+from schema import UserInput
+import features
+import cities
+from registry import ModelRegistry, ModelNotReady, MODEL_LOAD, MODEL_WATCH_INTERVAL
+from routing import CANARY_PATH, SHADOW_PATH, Router, Shadow
 
-@app.post('/predict')
-def predict_premium(data: UserInput):
+# the metrics package shared with patients_manager lives at the repo root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from observability import REGISTRY, instrument
 
-    input_df = pd.DataFrame([{
+# the ml model is loaded by the registry at startup (not at import), its
+# version comes from the artifact metadata. in real world we extract it from MLFlow
+registry = ModelRegistry()
+# optional canary / shadow versions next to it, see routing.py
+canary = ModelRegistry(CANARY_PATH) if CANARY_PATH else None
+shadow_model = ModelRegistry(SHADOW_PATH) if SHADOW_PATH else None
+# the models answering /predict, by role
+models = {'primary': registry, **({'canary': canary} if canary else {})}
+registries = [r for r in (registry, canary, shadow_model) if r]
+router = Router(registry, canary)
+# how long /predict waits for a lazily loading model before answering 503
+MODEL_READY_TIMEOUT = float(os.getenv('MODEL_READY_TIMEOUT', '30'))
+
+# the columns the model was trained on
+def model_input(data: UserInput) -> dict:
+    return {
         'bmi': data.bmi,
         'age_group': data.age_group,
         'lifestyle_risk': data.lifestyle_risk,
         'city_tier': data.city_tier,
         'income_lpa': data.income_lpa,
         'occupation': data.occupation
-    }])
+    }
+
+inference_duration = REGISTRY.histogram(
+    'model_inference_duration_seconds', 'Time in backend.predict per call', ('role', 'backend', 'version', 'output'),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0))
+inference_rows = REGISTRY.histogram(
+    'model_inference_rows', 'Rows scored per backend.predict call', ('backend',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 10000, 100000))
+
+# decimals kept in confidence / class probabilities, the rest is noise on
+# the wire (onnx computes them in float32)
+PROBA_DECIMALS = int(os.getenv('PREDICT_PROBA_DECIMALS', '4'))
+
+def predict_frame(input_df: pd.DataFrame, probabilities: bool = False, role: str = 'primary') -> list:
+    # every prediction (single, micro-batched or /predict/batch) goes through
+    # here. one label per row, or with probabilities a (label, confidence,
+    # class probabilities, classes) tuple per row, from the same model pass
+    return run_model(models[role].current, input_df, probabilities, role)
+
+def run_model(current, input_df, probabilities=False, role='primary'):
+    backend = current.backend
+    start = time.perf_counter()
+    if not probabilities:
+        predictions = backend.predict(input_df)
+    else:
+        labels, proba = backend.predict_proba(input_df)
+    inference_duration.labels(role, backend.name, current.version, 'probabilities' if probabilities else 'label').observe(time.perf_counter() - start)
+    inference_rows.labels(backend.name).observe(len(input_df))
+    if probabilities:
+        proba = proba.astype(float)
+        confidence = proba.max(axis=1).round(PROBA_DECIMALS).tolist()
+        predictions = [(label, c, p, backend.classes) for label, c, p in zip(labels, confidence, proba.round(PROBA_DECIMALS).tolist())]
+    return predictions
+
+def prediction_content(prediction, probabilities):
+    if not probabilities:
+        return {'predicted_category': prediction}
+    label, confidence, proba, classes = prediction
+    return {'predicted_category': label, 'confidence': confidence, 'class_probabilities': dict(zip(classes, proba))}
+
+# PREDICT_BATCHING=0 falls back to one predict call per request
+BATCHING = os.getenv('PREDICT_BATCHING', '1') == '1'
+batcher = MicroBatcher(predict_frame)
+batchers = {'primary': batcher}
+if canary:
+    batchers['canary'] = MicroBatcher(lambda frame, probabilities: predict_frame(frame, probabilities, 'canary'), role='canary')
+
+# scores answered requests off the critical path, None without a shadow model
+shadow = Shadow(shadow_model, lambda current, frame: run_model(current, frame, role='shadow')) if shadow_model else None
+
+# PREDICT_CACHE_SIZE=0 turns the cache off
+cache = PredictionCache()
+
+# changes whenever a different model load or version is serving (as
+# primary or canary), which is what invalidates the cache. the generation
+# counts loads, unlike id() it is not handed to a later model again
+def model_token():
+    return tuple((m.current.version, m.current.generation) if m.ready else None for m in models.values())
+
+async def watch_model():
+    # picks up a replaced artifact in every worker, without a restart
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        for model in registries:
+            try:
+                await asyncio.to_thread(model.reload_if_changed)
+            except Exception:
+                pass  # keep serving the old model, the error is on /stats
+
+async def load_optional(model):
+    # canary / shadow: a failed load leaves them without traffic, the
+    # primary keeps serving and the error is on /stats
+    try:
+        await asyncio.to_thread(model.load)
+    except Exception:
+        pass
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if MODEL_LOAD == 'lazy':
+        tasks.append(asyncio.create_task(asyncio.to_thread(registry.load)))
+    else:
+        await asyncio.to_thread(registry.load)
+    for model in (canary, shadow_model):
+        if model:
+            tasks.append(asyncio.create_task(load_optional(model)))
+    if MODEL_WATCH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(watch_model()))
+    if BATCHING:
+        for b in batchers.values():
+            b.start()
+    if shadow:
+        shadow.start()
+    yield
+    if shadow:
+        await shadow.stop()
+    for b in batchers.values():
+        await b.stop()
+    for task in tasks:
+        task.cancel()
+
+app = FastAPI(lifespan=lifespan)
+# per-route latency / status counters and GET /metrics
+instrument(app)
+REGISTRY.gauge_function('model_ready', '1 once a model is loaded and serving', (),
+                        lambda: {(): int(registry.ready)})
+REGISTRY.gauge_function('predict_batch_queue_depth', 'Rows waiting for the next micro-batch', (),
+                        lambda: {(): batcher.stats()['queue_depth']})
+REGISTRY.counter_function('predict_cache_lookups_total', 'Prediction cache lookups since start', ('result',),
+                        lambda: {(result,): cache.stats()[result] for result in ('hits', 'misses')})
+predict_duration = REGISTRY.histogram(
+    'predict_request_duration_seconds', 'Time to answer /predict by the model version that answered (cache, batching wait and inference)',
+    ('role', 'version'))
+if shadow:
+    REGISTRY.counter_function('model_shadow_comparisons_total', 'Answered requests scored by the shadow model since start',
+                              ('served_version', 'shadow_version', 'result'), lambda: dict(shadow.comparisons))
 
-    prediction = model.predict(input_df)[0]
+@app.exception_handler(ModelNotReady)
+def model_not_ready_handler(request: Request, exc: ModelNotReady):
+    return JSONResponse(status_code=503, content={'detail': 'Model is loading, try again shortly'}, headers={'Retry-After': '1'})
 
-    return JSONResponse(status_code=200, content={'predicted_category': prediction})
+async def ensure_model():
+    if not registry.ready:
+        await asyncio.to_thread(registry.wait_ready, MODEL_READY_TIMEOUT)
+
+PROBABILITIES_QUERY = Query(False, description='Also return confidence and class probabilities, from the same model pass')
+
+@app.post('/predict')
+async def predict_premium(data: UserInput, probabilities: bool = PROBABILITIES_QUERY):
+
+    started = time.perf_counter()
+    await ensure_model()
+    role = router.choose()
+    row = model_input(data)
+    if cache.enabled:
+        token = model_token()
+        key = (role, cache.key(row), probabilities)
+        hit, prediction = cache.get(key, token)
+        if hit:
+            return answer(role, row, prediction, probabilities, started)
+
+    if BATCHING:
+        prediction = await batchers[role].submit(row, probabilities)
+    else:
+        prediction = await asyncio.to_thread(lambda: predict_frame(pd.DataFrame([row]), probabilities, role)[0])
+
+    if cache.enabled:
+        cache.put(key, prediction, token)
+
+    return answer(role, row, prediction, probabilities, started)
+
+def answer(role, row, prediction, probabilities, started):
+    version = models[role].current.version
+    predict_duration.labels(role, version).observe(time.perf_counter() - started)
+    if shadow:
+        shadow.submit(row, prediction[0] if probabilities else prediction, version)
+    return JSONResponse(status_code=200, content=prediction_content(prediction, probabilities), headers={'X-Model-Version': version})
+
+# largest number of rows accepted by /predict/batch in one request
+BATCH_MAX_ROWS = int(os.getenv('PREDICT_BATCH_MAX_ROWS', '100000'))
+user_inputs = TypeAdapter(list[UserInput])
+
+@app.post('/predict/batch', openapi_extra={'requestBody': {'required': True, 'content': {
+    'application/json': {'schema': {'type': 'array', 'items': UserInput.model_json_schema()}},
+    **{t: {'schema': {'type': 'string', 'format': 'binary'}} for t in features.UPLOAD_TYPES},
+}}})
+async def predict_batch(request: Request, probabilities: bool = PROBABILITIES_QUERY):
+    # a JSON array of UserInput, or a CSV / Arrow IPC / Parquet upload with
+    # the same columns. predictions come back in input order, probabilities
+    # as parallel lists with the class names once (not a dict per row).
+    # always the primary model, canary and shadow only see /predict
+    content_type = request.headers.get('content-type', 'application/json').split(';')[0].strip()
+    body = await request.body()
+
+    try:
+        if content_type == 'application/json':
+            raw = features.from_inputs(user_inputs.validate_json(body))
+        elif content_type in features.UPLOAD_TYPES:
+            raw = features.validate_frame(features.read_upload(body, content_type))
+        else:
+            raise HTTPException(status_code=415, detail=f'Send application/json or one of {features.UPLOAD_TYPES}')
+    except ValidationError as e:
+        errors = e.errors(include_url=False, include_context=False, include_input=False)
+        # a body that is not JSON at all is a bad request, like an unreadable upload
+        if any(error['type'] == 'json_invalid' for error in errors):
+            raise HTTPException(status_code=400, detail=f'Could not read body: {errors[0]["msg"]}')
+        raise HTTPException(status_code=422, detail=errors)
+    except features.InvalidBatch as e:
+        raise HTTPException(status_code=422, detail=e.errors[:100])
+    except ImportError:
+        raise HTTPException(status_code=415, detail='Arrow and Parquet uploads need pyarrow installed')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'Could not read upload: {e}')
+
+    if len(raw) > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f'At most {BATCH_MAX_ROWS} rows per request')
+
+    await ensure_model()
+    predictions = await asyncio.to_thread(lambda: predict_frame(features.engineer(raw), probabilities) if len(raw) else [])
+    if not probabilities:
+        return JSONResponse(status_code=200, content={'predictions': predictions})
+    classes = predictions[0][3] if predictions else registry.current.backend.classes
+    return JSONResponse(status_code=200, content={
+        'predictions': [p[0] for p in predictions],
+        'confidence': [p[1] for p in predictions],
+        'classes': list(classes),
+        'probabilities': [p[2] for p in predictions],
+    })
 
 @app.get('/')
 def home():
     return JSONResponse(status_code=200, content={'message': 'Welcome to the Insurance Premium Category Predictor'})
 
-# machine health check 
+@app.post('/model/reload')
+async def reload_model(path: Optional[str] = Body(None, embed=True, description='Artifact inside the models directory, defaults to the current one')):
+    # only artifacts from the models directory, unpickling runs code
+    if path is not None:
+        models_dir = os.path.realpath('./models')
+        path = os.path.realpath(path)
+        if os.path.dirname(path) != models_dir or not path.endswith(('.pkl', '.joblib')):
+            raise HTTPException(status_code=400, detail='path must be a .pkl or .joblib file in the models directory')
+    try:
+        loaded = await asyncio.to_thread(registry.load, path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Reload failed, still serving the previous model: {e}')
+    return {'message': 'Model reloaded', 'model_version': loaded.version, 'path': loaded.path}
+
+@app.get('/stats')
+def stats():
+    return {
+        'model': registry.stats(),
+        'canary': router.stats(),
+        'shadow': shadow.stats() if shadow else None,
+        'batching': batcher.stats() if BATCHING else None,
+        'canary_batching': batchers['canary'].stats() if BATCHING and canary else None,
+        'cache': cache.stats() if cache.enabled else None,
+        'cities': cities.stats(),
+    }
+
+# machine health check: 200 only when a model is loaded and warmed and the
+# batcher (if enabled) is running, 503 otherwise so a load balancer holds
+# traffic back while the worker starts or after a failed load
 @app.get('/health')
 def health_check():
-    return {
-        'status':"OK",
-        "is_model_loaded": "model Loaded" if model else "model not loaded",
-        'model_version': MODEL_VERSION,
+    ready = registry.ready
+    batching_ok = not BATCHING or batcher.running
+    model = registry.current if ready else None
+    content = {
+        'status': "OK" if ready and batching_ok else "LOADING" if not ready else "DEGRADED",
+        "is_model_loaded": "model Loaded" if ready else "model not loaded",
+        'model_version': model.version if model else None,
+        'backend': model.backend.name if model else None,
+        'model_warm': model.warm if model else False,
+        'batching': ('running' if batcher.running else 'stopped') if BATCHING else 'off',
+        'last_error': registry.last_error,
         'version': '1.0.0',
-        'status_code': 200
     }
+    return JSONResponse(status_code=200 if ready and batching_ok else 503, content=content)
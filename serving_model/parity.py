@@ -0,0 +1,60 @@
+import random
+import sys
+
+import numpy as np
+
+import features
+from schema import UserInput, tier_1_cities, tier_2_cities
+
+# checks that features.engineer (column-wise) gives exactly the values the
+# UserInput computed fields give, row by row. run after touching either:
+#
+#   python parity.py [rows]
+
+OCCUPATIONS = features.OCCUPATIONS
+
+
+def random_inputs(n, seed=0):
+    rng = random.Random(seed)
+    cities = tier_1_cities + tier_2_cities + ['Nowhere', 'springfield']
+    inputs = []
+    for _ in range(n):
+        height = rng.choice([rng.uniform(0.5, 2.49), 1.7, 2.0])
+        # land exactly on the 27 / 30 bmi thresholds now and then
+        weight = rng.choice([rng.uniform(20, 200), 27 * height ** 2, 30 * height ** 2])
+        city = rng.choice(cities)
+        city = rng.choice([city, city.lower(), city.upper(), f'  {city} '])
+        inputs.append({
+            'age': rng.choice([rng.randint(1, 119), 24, 25, 44, 45, 59, 60]),
+            'weight': weight,
+            'height': height,
+            'income_lpa': rng.uniform(0.1, 100),
+            'smoker': rng.random() < 0.4,
+            'city': city,
+            'occupation': rng.choice(OCCUPATIONS),
+        })
+    return [UserInput(**i) for i in inputs]
+
+
+def check(inputs):
+    # returns a list of (row, column, expected, got) mismatches
+    frame = features.engineer(features.from_inputs(inputs))
+    mismatches = []
+    for row, data in enumerate(inputs):
+        for column in features.FEATURE_COLUMNS:
+            expected = getattr(data, column)
+            got = frame[column].iloc[row]
+            if isinstance(got, np.generic):
+                got = got.item()
+            if type(expected) is not type(got) or expected != got:
+                mismatches.append((row, column, expected, got))
+    return mismatches
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    mismatches = check(random_inputs(n))
+    for mismatch in mismatches[:20]:
+        print('row %d %s: UserInput=%r vectorized=%r' % mismatch)
+    print(f'{n} rows, {len(mismatches)} mismatches')
+    sys.exit(1 if mismatches else 0)
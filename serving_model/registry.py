@@ -0,0 +1,237 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from backends import build_backend, cached_backend, cached_meta
+
+# owns the serving model: where it is loaded from, which version it is, and
+# swapping in a new artifact while requests keep flowing.
+#
+# artifacts are models/<name>.pkl (plain pickle) or models/<name>.joblib.
+# joblib artifacts are loaded with mmap_mode='r', so the numpy arrays in
+# them are read-only views of the page cache and every worker process on
+# the machine shares one physical copy. the version comes from the sidecar
+# models/<name>.<ext>.json ({"version": "..."}), or the artifact's content hash.
+#
+#   python registry.py export models/model.pkl models/model.joblib --version 1.0.0
+
+# the default is next to this file, so the app starts from any directory
+MODEL_PATH = os.getenv('MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'model.pkl'))
+MODEL_MMAP = os.getenv('MODEL_MMAP', '1') == '1'
+# eager: load during startup, lazy: start serving at once and load in the
+# background (/predict waits for it, /health reports not ready meanwhile)
+MODEL_LOAD = os.getenv('MODEL_LOAD', 'eager')
+# seconds between checks of the artifact for a newer file, 0 = never
+MODEL_WATCH_INTERVAL = float(os.getenv('MODEL_WATCH_INTERVAL', '0'))
+
+# one realistic row, predicted once after every load so the first real
+# request doesn't pay for lazy initialisation inside pandas / sklearn
+WARMUP_ROW = {
+    'bmi': 24.0, 'age_group': 'adult', 'lifestyle_risk': 'low',
+    'city_tier': 1, 'income_lpa': 10.0, 'occupation': 'private_job',
+}
+
+
+class ModelNotReady(Exception):
+    pass
+
+
+def metadata_path(path):
+    return path + '.json'
+
+
+def read_version(path):
+    meta = metadata_path(path)
+    if os.path.exists(meta):
+        with open(meta) as f:
+            version = json.load(f).get('version')
+        if version:
+            return str(version)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return 'sha256:' + digest.hexdigest()[:12]
+
+
+def load_artifact(path, mmap=MODEL_MMAP):
+    if path.endswith('.joblib'):
+        import joblib
+        return joblib.load(path, mmap_mode='r' if mmap else None)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def artifact_stamp(path):
+    # changes when the artifact or its metadata is replaced
+    stamps = []
+    for p in (path, metadata_path(path)):
+        try:
+            st = os.stat(p)
+            stamps.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        except FileNotFoundError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+class LoadedModel:
+
+    def __init__(self, backend, backend_info, version, path, load_seconds):
+        # what actually runs predictions, see backends.py
+        self.backend = backend
+        self.backend_info = backend_info
+        self.version = version
+        self.path = path
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.stamp = artifact_stamp(path)
+        self.warm = False
+        # set by the registry once this model is serving, see ModelRegistry.loads
+        self.generation = None
+
+    def warm_up(self):
+        self.backend.predict(pd.DataFrame([WARMUP_ROW]))
+        self.warm = True
+
+
+class ModelRegistry:
+
+    def __init__(self, path=MODEL_PATH, mmap=MODEL_MMAP):
+        self.path = path
+        self.mmap = mmap
+        self._current = None
+        self._ready = threading.Event()
+        self._reload_lock = threading.Lock()
+        # (path, stamp, model, seconds) read by preload() before a fork
+        self._preloaded = None
+        # successful loads so far, never reused: a model's generation tells
+        # it apart from every other one this registry served
+        self.loads = 0
+        self.reloads = 0
+        self.last_error = None
+
+    @property
+    def current(self) -> LoadedModel:
+        # one attribute read, so a request sees either the old or the new
+        # model, never a mix
+        current = self._current
+        if current is None:
+            raise ModelNotReady('model is still loading')
+        return current
+
+    @property
+    def ready(self):
+        return self._current is not None
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def preload(self, path=None):
+        # reads the artifact without building a backend, for a parent process
+        # about to fork workers (serve.py): the model's pages are then shared
+        # copy-on-write, and each worker's load() builds its own backend on
+        # top (an onnxruntime session does not survive a fork)
+        path = path or self.path
+        if cached_meta(path) is not None:
+            # the workers build their sessions from the cached graph and never
+            # unpickle, only onnxruntime itself is worth sharing
+            import onnxruntime  # noqa: F401
+            return
+        start = time.perf_counter()
+        stamp = artifact_stamp(path)
+        self._preloaded = (path, stamp, load_artifact(path, self.mmap), time.perf_counter() - start)
+
+    def _load(self, path):
+        # load_seconds covers reading the artifact and building the backend
+        start = time.perf_counter()
+        cached = cached_backend(path)
+        if cached is not None:
+            backend, info = cached
+        else:
+            preloaded = self._preloaded
+            if preloaded and preloaded[0] == path and preloaded[1] == artifact_stamp(path):
+                model = preloaded[2]
+            else:
+                model = load_artifact(path, self.mmap)
+            backend, info = build_backend(model, cache_path=path)
+        loaded = LoadedModel(backend, info, read_version(path), path, time.perf_counter() - start)
+        loaded.warm_up()
+        return loaded
+
+    def load(self, path=None):
+        # loads (and warms) the new artifact completely before it replaces
+        # the old one, in-flight requests finish on the model they started with
+        path = path or self.path
+        with self._reload_lock:
+            try:
+                loaded = self._load(path)
+            except Exception as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                raise
+            if self._current is not None:
+                self.reloads += 1
+            self.loads += 1
+            loaded.generation = self.loads
+            self.path = path
+            self._current = loaded
+            self.last_error = None
+            self._ready.set()
+            return loaded
+
+    def reload_if_changed(self):
+        current = self._current
+        if current is not None and artifact_stamp(self.path) != current.stamp:
+            return self.load()
+        return None
+
+    def stats(self):
+        current = self._current
+        if current is None:
+            return {'loaded': False, 'path': self.path, 'last_error': self.last_error}
+        return {
+            'loaded': True,
+            'version': current.version,
+            'path': current.path,
+            'mmap': self.mmap and current.path.endswith('.joblib'),
+            'warm': current.warm,
+            **current.backend_info,
+            'load_seconds': round(current.load_seconds, 4),
+            'loaded_at': current.loaded_at,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+        }
+
+
+def export(args):
+    # converts a pickle artifact to joblib (uncompressed, so it can be mmapped)
+    # and writes the version sidecar next to it
+    import joblib
+
+    model = load_artifact(args.source, mmap=False)
+    tmp = args.target + '.tmp'
+    joblib.dump(model, tmp)
+    os.replace(tmp, args.target)
+    meta = {'version': args.version or read_version(args.source), 'source': os.path.basename(args.source)}
+    with open(metadata_path(args.target) + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(metadata_path(args.target) + '.tmp', metadata_path(args.target))
+    print(f'wrote {args.target} ({meta["version"]})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='model artifact tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help='convert a pickled model to an mmap-able joblib artifact')
+    exp.add_argument('source')
+    exp.add_argument('target')
+    exp.add_argument('--version')
+    exp.set_defaults(func=export)
+    args = parser.parse_args()
+    sys.exit(args.func(args))
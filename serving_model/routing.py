@@ -0,0 +1,119 @@
+import asyncio
+import os
+import random
+
+import pandas as pd
+
+# A/B serving next to the primary model (registry.MODEL_PATH). a canary
+# artifact answers MODEL_CANARY_PERCENT of /predict requests; a shadow
+# artifact scores the answered requests in the background and only counts
+# how often it would have answered differently. both are optional, are
+# loaded by their own ModelRegistry (so they have their own version and
+# reload) and get no traffic until they are loaded.
+#
+#   MODEL_CANARY_PATH=./models/model-v2.joblib MODEL_CANARY_PERCENT=10
+#   MODEL_SHADOW_PATH=./models/model-v3.joblib
+
+CANARY_PATH = os.getenv('MODEL_CANARY_PATH') or None
+CANARY_PERCENT = float(os.getenv('MODEL_CANARY_PERCENT', '0'))
+SHADOW_PATH = os.getenv('MODEL_SHADOW_PATH') or None
+# the shadow gathers requests this long and scores them as one batch, so it
+# costs one vectorized call per window instead of one per request
+SHADOW_WINDOW_MS = float(os.getenv('MODEL_SHADOW_WINDOW_MS', '250'))
+SHADOW_MAX_BATCH = int(os.getenv('MODEL_SHADOW_MAX_BATCH', '1024'))
+# requests beyond this many waiting for the shadow are not compared
+SHADOW_MAX_PENDING = int(os.getenv('MODEL_SHADOW_MAX_PENDING', '10000'))
+
+
+class Router:
+
+    def __init__(self, primary, canary=None, canary_percent=CANARY_PERCENT):
+        self.primary = primary
+        self.canary = canary
+        self.canary_percent = canary_percent
+
+    def choose(self):
+        # 'primary' or 'canary', per request
+        if self.canary is not None and self.canary.ready and random.random() * 100 < self.canary_percent:
+            return 'canary'
+        return 'primary'
+
+    def stats(self):
+        if self.canary is None:
+            return None
+        return {'percent': self.canary_percent, **self.canary.stats()}
+
+
+class Shadow:
+
+    def __init__(self, registry, score, window_ms=SHADOW_WINDOW_MS, max_batch=SHADOW_MAX_BATCH,
+                 max_pending=SHADOW_MAX_PENDING):
+        # score(loaded_model, frame) returns one label per row
+        self.registry = registry
+        self.score = score
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._queue = None
+        self._task = None
+        # (served version, shadow version, 'agree' | 'disagree') -> rows
+        self.comparisons = {}
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        # needs a running loop, call from the app startup
+        if self._task is None:
+            self._queue = asyncio.Queue(self.max_pending)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(self, row, served_label, served_version):
+        # called on the request path: no await, no future, one queue append
+        if self._task is None or not self.registry.ready:
+            return
+        try:
+            self._queue.put_nowait((row, served_label, served_version))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            current = self.registry.current
+            try:
+                labels = await asyncio.to_thread(self.score, current, pd.DataFrame([row for row, _, _ in batch]))
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f'{type(e).__name__}: {e}'
+                continue
+            for (_, served_label, served_version), label in zip(batch, labels):
+                key = (served_version, current.version, 'agree' if label == served_label else 'disagree')
+                self.comparisons[key] = self.comparisons.get(key, 0) + 1
+
+    def stats(self):
+        compared = sum(self.comparisons.values())
+        disagreed = sum(n for (_, _, result), n in self.comparisons.items() if result == 'disagree')
+        return {
+            **self.registry.stats(),
+            'window_ms': self.window * 1000,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'compared': compared,
+            'disagreed': disagreed,
+            'disagreement_rate': round(disagreed / compared, 4) if compared else 0.0,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'score_error': self.last_error,
+        }
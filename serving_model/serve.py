@@ -0,0 +1,35 @@
+import argparse
+import os
+import sys
+
+# runs the API in several worker processes on one port:
+#
+#   python serve.py --workers 4 --port 8000
+#
+# the parent unpickles the model once and then forks, so every worker
+# starts from the same copy-on-write pages instead of its own copy
+# (a .joblib artifact with MODEL_MMAP=1 shares its arrays through the page
+# cache on top of that). each worker builds its backend, warms up and
+# batches on its own, there is nothing else they share. canary and shadow
+# artifacts (routing.py) are preloaded the same way
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from prefork import serve
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve the model API with several worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+
+    import main as api
+    for model in api.registries:
+        model.preload()
+    serve(api.app, args.workers, args.host, args.port, log_level=args.log_level)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the app's modules import each other as top level modules (from schema
+# import ...), the tests run from any directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,5 @@
+import parity
+
+
+def test_engineer_matches_user_input():
+    assert parity.check(parity.random_inputs(5_000, seed=1)) == []
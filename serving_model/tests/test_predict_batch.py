@@ -0,0 +1,30 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(main.app, raise_server_exceptions=False) as client:
+        yield client
+
+
+def test_invalid_json_is_a_bad_request(client):
+    response = client.post('/predict/batch', content=b'{bad', headers={'content-type': 'application/json'})
+    assert response.status_code == 400
+    assert 'Could not read body' in response.json()['detail']
+
+
+def test_invalid_row_is_unprocessable(client):
+    response = client.post('/predict/batch', json=[{'age': 'old'}])
+    assert response.status_code == 422
+    assert all('input' not in error for error in response.json()['detail'])
+
+
+def test_predictions_in_input_order(client):
+    row = {'age': 34, 'weight': 72.5, 'height': 1.76, 'income_lpa': 12.0, 'smoker': False,
+           'city': 'Pune', 'occupation': 'private_job'}
+    response = client.post('/predict/batch', json=[row, row])
+    assert response.status_code == 200
+    assert len(response.json()['predictions']) == 2
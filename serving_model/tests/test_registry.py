@@ -0,0 +1,15 @@
+import os
+
+from registry import ModelRegistry
+
+MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'models', 'model.pkl')
+
+
+def test_every_load_gets_a_new_generation():
+    registry = ModelRegistry(MODEL)
+    first = registry.load()
+    second = registry.load()
+    # same artifact and version, still two different models for the cache
+    assert first.version == second.version
+    assert (first.generation, second.generation) == (1, 2)
+    assert registry.loads == 2 and registry.reloads == 1